@@ -0,0 +1,215 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Benchmark suite for the package splitting engine. Synthetic install
+#  manifests of each size are split in a fresh process, timing each stage
+#  and recording the peak memory, then compared against a stored baseline.
+#  A slice of the paths is added twice under competing patterns, so that
+#  the exclusion pass in emit_packages has real work to do.
+#  Timings are machine specific, so regenerate the baseline with --save on
+#  the machine used for release checks.
+#
+#  Usage:
+#      splitting.py                    Run and compare against the baseline
+#      splitting.py --save             Run and store a new baseline
+#      splitting.py --sizes 1000,10000 Only run the given sizes
+#
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ypkg2.packages import PackageGenerator, PRIORITY_USER  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__),
+                                "splitting_baseline.json")
+
+# Stages timed for every size, in order
+Stages = ["add_file", "emit_packages", "emit_files", "emit_files_by_pattern"]
+
+Locales = ["de", "en_GB", "es", "fr", "it", "ja", "pt_BR", "ru", "zh_CN"]
+
+
+class Spec:
+
+    pkg_name = "bench"
+    pkg_libsplit = True
+
+
+def make_manifest(count):
+    """ Yield count paths shaped roughly like a large real install: mostly
+        data under share, with libraries, headers, locales and debug info """
+    i = 0
+    while True:
+        group = i // 64
+        shapes = [
+            "/usr/lib64/libbench{0}.so.1.0.0",
+            "/usr/lib64/libbench{0}.so.1",
+            "/usr/lib64/libbench{0}.so",
+            "/usr/lib64/pkgconfig/bench{0}.pc",
+            "/usr/lib32/libbench{0}.so.1.0.0",
+            "/usr/include/bench/mod{1}/header{0}.h",
+            "/usr/include/bench/mod{1}/private/impl{0}.h",
+            "/usr/share/locale/{2}/LC_MESSAGES/bench{0}.mo",
+            "/usr/lib/debug/.build-id/{3:02x}/{0:038x}.debug",
+            "/usr/lib64/bench/plugins/plugin{0}.so",
+            "/usr/bin/bench-tool{0}",
+            "/usr/share/doc/bench/html/page{0}.html",
+            "/usr/share/bench/data/set{1}/item{0}.dat",
+            "/usr/share/bench/data/set{1}/deep/tree/item{0}.dat",
+            "/usr/share/bench/data/set{1}/deep/tree/more{0}.dat",
+            "/usr/share/bench/tests/case{1}/test{0}.py",
+        ]
+        for shape in shapes:
+            if i >= count:
+                return
+            yield shape.format(i, group, Locales[i % len(Locales)], i % 256)
+            i += 1
+
+
+def run_size(count):
+    """ Run every stage for a single size, returning the results """
+    paths = list(make_manifest(count))
+    ret = dict()
+
+    start = time.time()
+    gene = PackageGenerator(Spec())
+    gene.add_pattern("/usr/share/bench/tests/", "tests",
+                     priority=PRIORITY_USER)
+    gene.add_pattern("/usr/lib64/bench/plugins/*.so", "plugins",
+                     priority=PRIORITY_USER)
+    for path in paths:
+        gene.add_file(path)
+    # Steal the data files with a higher priority pattern, leaving them
+    # held by two packages so that emit_packages has to exclude them
+    gene.add_pattern("/usr/share/bench/data/", "data",
+                     priority=PRIORITY_USER + 1)
+    for path in paths:
+        if path.startswith("/usr/share/bench/data/"):
+            gene.add_file(path)
+    ret["add_file"] = time.time() - start
+    del paths
+
+    start = time.time()
+    gene.emit_packages()
+    ret["emit_packages"] = time.time() - start
+
+    start = time.time()
+    for pkg in gene.packages.values():
+        pkg.emit_files()
+    ret["emit_files"] = time.time() - start
+
+    start = time.time()
+    for pkg in gene.packages.values():
+        pkg.emit_files_by_pattern()
+    ret["emit_files_by_pattern"] = time.time() - start
+
+    # Kilobytes on Linux
+    ret["peak_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return ret
+
+
+def run_isolated(count):
+    """ Run a size in a fresh process so peak memory isn't shared """
+    cmd = [sys.executable, os.path.abspath(__file__), "--run", str(count)]
+    out = subprocess.check_output(cmd)
+    return json.loads(out)
+
+
+def compare(results, baseline, threshold):
+    """ Print the results alongside the baseline, returning the number of
+        regressions beyond the threshold """
+    regressions = 0
+    print("{:>8} {:<22} {:>10} {:>10} {:>7}".format("Paths", "Stage",
+                                                    "Current", "Baseline",
+                                                    "Ratio"))
+    for size in sorted(results, key=int):
+        cur = results[size]
+        base = baseline.get(size)
+        for stage in Stages + ["peak_kb"]:
+            ratio = None
+            if base is not None and base.get(stage):
+                ratio = cur[stage] / float(base[stage])
+            fmt = "{:>10.3f}" if stage != "peak_kb" else "{:>10.0f}"
+            line = "{:>8} {:<22} ".format(size, stage)
+            line += fmt.format(cur[stage])
+            if ratio is None:
+                line += " {:>10} {:>7}".format("-", "-")
+            else:
+                line += " " + fmt.format(base[stage])
+                line += " {:>7.2f}".format(ratio)
+                # Ignore noise from stages too quick to measure reliably
+                if ratio > threshold and cur[stage] > 0.05:
+                    line += "  REGRESSION"
+                    regressions += 1
+            print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Package splitting "
+                                     "benchmark suite")
+    parser.add_argument("--sizes", type=str,
+                        help="Comma separated manifest sizes")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE,
+                        help="Baseline file to compare with or save to")
+    parser.add_argument("--save", action="store_true",
+                        help="Store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Ratio over the baseline counted as a "
+                        "regression")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        print(json.dumps(run_size(args.run)))
+        return 0
+
+    sizes = DEFAULT_SIZES
+    if args.sizes:
+        sizes = [int(x) for x in args.sizes.split(",")]
+
+    results = dict()
+    for size in sizes:
+        results[str(size)] = run_isolated(size)
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as inp:
+            baseline = json.load(inp)
+
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, "w") as out:
+            json.dump(baseline, out, indent=4, sort_keys=True)
+            out.write("\n")
+        print("\nSaved baseline to {}".format(args.baseline))
+        return 0
+
+    if regressions > 0:
+        print("\n{} regressions over {:.2f}x the baseline".format(
+              regressions, args.threshold))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Micro-benchmark for StringPathGlob.match, testing every built-in
+#  pattern against a synthetic install tree, splitting each path once per
+#  pattern and once per file. Both are compared with a reference copy of
+#  the original matcher, which split and fnmatch'd on every call.
+#
+
+import fnmatch
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ypkg2.packages import PackageGenerator  # noqa: E402
+from ypkg2.stringglob import StringPathGlob  # noqa: E402
+
+
+class Spec:
+
+    pkg_name = "bench"
+    pkg_libsplit = True
+
+
+def reference_match(glob, path):
+    """ The original StringPathGlob.match, before components were compiled
+        once up front """
+    if glob.prefixMatch:
+        if glob.pattern.endswith(os.sep) and not \
+          StringPathGlob.is_a_pattern(glob.pattern):
+            if path.startswith(glob.pattern):
+                return True
+        return False
+
+    our_splits = glob.pattern.split(os.sep)
+    test_splits = path.split(os.sep)
+
+    their_len = len(test_splits)
+    our_len = len(our_splits)
+
+    if our_len > their_len:
+        return False
+
+    for i in range(0, our_len):
+        our_elem = our_splits[i]
+        their_elem = test_splits[i]
+
+        if our_elem == their_elem:
+            continue
+
+        if StringPathGlob.is_a_pattern(our_elem):
+            if not fnmatch.fnmatchcase(their_elem, our_elem):
+                return False
+        else:
+            return False
+
+    return True
+
+
+def make_paths(count):
+    """ A rough mix of the directories found in a real install """
+    dirs = ["/usr/bin", "/usr/lib64", "/usr/lib64/pkgconfig",
+            "/usr/include/bench/sub", "/usr/share/doc/bench",
+            "/usr/share/locale/en/LC_MESSAGES", "/usr/lib64/bench/plugins",
+            "/usr/share/bench/data/deep/tree", "/usr/lib32"]
+    names = ["lib{}.so.1", "lib{}.so", "{}.h", "{}.pc", "{}.mo", "file{}"]
+    ret = list()
+    for i in range(0, count):
+        d = dirs[i % len(dirs)]
+        n = names[i % len(names)].format(i)
+        ret.append("{}/{}".format(d, n))
+    return ret
+
+
+def main():
+    count = 20000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+
+    gene = PackageGenerator(Spec())
+    globs = list(gene.patterns)
+    paths = make_paths(count)
+
+    def reference():
+        for path in paths:
+            for glob in globs:
+                reference_match(glob, path)
+
+    def per_pattern():
+        for path in paths:
+            for glob in globs:
+                glob.match(path)
+
+    def per_file():
+        for path in paths:
+            splits = path.split(os.sep)
+            for glob in globs:
+                glob.match(path, splits)
+
+    # The compiled matcher must agree with the reference
+    for path in paths:
+        for glob in globs:
+            if glob.match(path) != reference_match(glob, path):
+                print("Mismatch: {} against {}".format(glob, path))
+                return 1
+
+    print("{} paths, {} patterns".format(len(paths), len(globs)))
+    base = None
+    for name, func in [("reference (fnmatch)", reference),
+                       ("split per pattern", per_pattern),
+                       ("split per file", per_file)]:
+        best = min(timeit.repeat(func, number=1, repeat=3))
+        calls = len(paths) * len(globs)
+        if base is None:
+            base = best
+        print("{:<20} {:>8.3f}s {:>10.0f} matches/s {:>6.2f}x".format(
+              name, best, calls / best, base / best))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
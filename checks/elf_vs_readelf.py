@@ -0,0 +1,141 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Corpus check for the in-process ELF reader. Every ELF object found
+#  under the given directories, i.e. an install tree, is read with ElfFile
+#  and with readelf, and the needed libraries, soname, rpaths, runpaths and
+#  build-id compared.
+#
+#  Usage:
+#      elf_vs_readelf.py                   Check /usr/lib64 and /usr/bin
+#      elf_vs_readelf.py --limit 500 DIR   Check at most 500 objects in DIR
+#
+
+import argparse
+import os
+import re
+import stat
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ypkg2.elf import ElfFile, ElfError, read_header_type  # noqa: E402
+
+DEFAULT_DIRS = ["/usr/lib64", "/usr/bin"]
+
+# Dynamic entries of interest, as printed by readelf -d
+readelf_dyn = re.compile(r"\((NEEDED|SONAME|RPATH|RUNPATH)\)\s+"
+                         r"[^\[]*\[(.*)\]$")
+readelf_build_id = re.compile(r"Build ID: ([0-9a-f]+)\s*$")
+
+Fields = ["needed", "soname", "rpaths", "runpaths", "build_id"]
+
+
+def find_objects(dirs):
+    """ Yield every regular ELF object under the given directories """
+    for top in dirs:
+        for root, subdirs, files in os.walk(top):
+            for f in sorted(files):
+                fpath = os.path.join(root, f)
+                try:
+                    st = os.lstat(fpath)
+                except Exception as e:
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                if read_header_type(fpath) is None:
+                    continue
+                yield fpath
+
+
+def read_ours(path):
+    elf = ElfFile(path)
+    return {
+        "needed": elf.needed,
+        "soname": elf.soname,
+        "rpaths": elf.rpaths,
+        "runpaths": elf.runpaths,
+        "build_id": elf.get_build_id(),
+    }
+
+
+def read_readelf(path):
+    env = dict(os.environ)
+    env["LC_ALL"] = "C"
+    out = subprocess.check_output(["readelf", "-d", "-n", "-W", path],
+                                  env=env, stderr=open(os.devnull, "w"))
+    ret = {
+        "needed": [],
+        "soname": None,
+        "rpaths": [],
+        "runpaths": [],
+        "build_id": None,
+    }
+    for line in out.split("\n"):
+        m = readelf_dyn.search(line)
+        if m is not None:
+            tag, value = m.groups()
+            if tag == "NEEDED":
+                ret["needed"].append(value)
+            elif tag == "SONAME":
+                ret["soname"] = value
+            elif tag == "RPATH":
+                ret["rpaths"].append(value)
+            else:
+                ret["runpaths"].append(value)
+            continue
+        m = readelf_build_id.search(line)
+        if m is not None and ret["build_id"] is None:
+            ret["build_id"] = m.group(1)
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ElfFile with "
+                                     "readelf over a corpus of objects")
+    parser.add_argument("dirs", nargs="*", default=DEFAULT_DIRS,
+                        help="Directories to search for ELF objects")
+    parser.add_argument("--limit", type=int,
+                        help="Maximum number of objects to check")
+    args = parser.parse_args()
+
+    checked = 0
+    failures = 0
+    for path in find_objects(args.dirs):
+        if args.limit is not None and checked >= args.limit:
+            break
+        try:
+            theirs = read_readelf(path)
+        except Exception as e:
+            # readelf can't make sense of it either, nothing to compare
+            continue
+        checked += 1
+        try:
+            ours = read_ours(path)
+        except ElfError as e:
+            print("{}: {}".format(path, e))
+            failures += 1
+            continue
+        for field in Fields:
+            if ours[field] == theirs[field]:
+                continue
+            print("{}: {} differs\n    ours:    {}\n    readelf: {}".format(
+                  path, field, ours[field], theirs[field]))
+            failures += 1
+
+    print("{} objects checked, {} differences".format(checked, failures))
+    return 1 if failures > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Check of the fused eu-strip backend against the real eu-strip. A small
+#  shared library and executable are built with debug info and run through
+#  split_and_strip, then the stripped objects, their debuglinks and the
+#  debug files are verified, along with hard links being left alone.
+#
+#  Usage:
+#      fused_strip.py                 Skips if eu-strip or gcc are missing
+#      fused_strip.py --eu-strip PATH Use a specific eu-strip
+#
+
+import argparse
+import binascii
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from distutils.spawn import find_executable  # noqa: E402
+from ypkg2.elf import ElfFile  # noqa: E402
+from ypkg2.examine import split_and_strip  # noqa: E402
+from ypkg2.timings import ToolTimings  # noqa: E402
+
+LibSource = "int foo(int x) { return x * 2; }\n"
+ProgSource = "int foo(int);\nint main() { return foo(0); }\n"
+
+
+class Context:
+    """ The bits of ExamineContext used by split_and_strip """
+
+    install_dir = None
+    eu_strip = None
+    can_dbginfo = True
+
+    def __init__(self, install_dir, eu_strip):
+        self.install_dir = install_dir
+        self.eu_strip = eu_strip
+
+    def get_install_dir(self):
+        return self.install_dir
+
+
+def read_section(elf, name):
+    """ Return the raw contents of the named section, or None """
+    for sect in elf.sections:
+        if sect.name != name:
+            continue
+        with open(elf.path, "rb") as inp:
+            inp.seek(sect.offset)
+            return inp.read(sect.size)
+    return None
+
+
+def check_stripped(path, did_full):
+    """ Return a list of problems with a stripped object and its debug
+        file, which should be empty """
+    problems = list()
+    elf = ElfFile(path)
+    names = elf.get_section_names()
+    if elf.has_symbols():
+        problems.append("symbols or debug sections left in {}".format(path))
+    if ".dynsym" not in names:
+        problems.append(".dynsym missing from {}".format(path))
+
+    link = read_section(elf, ".gnu_debuglink")
+    if link is None:
+        problems.append("no .gnu_debuglink in {}".format(path))
+    elif not os.path.exists(did_full):
+        problems.append("debug file {} missing".format(did_full))
+    else:
+        name = link[0:link.index(b"\0")]
+        crc = struct.unpack("<I", link[-4:])[0]
+        if name != os.path.basename(did_full):
+            problems.append("debuglink of {} names {}".format(path, name))
+        with open(did_full, "rb") as inp:
+            want = binascii.crc32(inp.read()) & 0xffffffff
+        if crc != want:
+            problems.append("debuglink CRC mismatch in {}".format(path))
+
+    if os.path.exists(did_full):
+        # Debug files keep only NOBITS copies of the dynamic sections, which
+        # ElfFile rightly refuses, so ask readelf instead
+        out = subprocess.check_output(["readelf", "-S", "-W", did_full],
+                                      env={"LC_ALL": "C"},
+                                      stderr=open(os.devnull, "w"))
+        if " .debug_info " not in out:
+            problems.append("no .debug_info in {}".format(did_full))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the fused eu-strip "
+                                     "backend against the real eu-strip")
+    parser.add_argument("--eu-strip", type=str,
+                        help="eu-strip to test, instead of the one on PATH")
+    args = parser.parse_args()
+
+    eu_strip = args.eu_strip or find_executable("eu-strip")
+    gcc = find_executable("gcc")
+    if eu_strip is None or gcc is None:
+        print("eu-strip or gcc not found, skipping")
+        return 0
+
+    tmp = tempfile.mkdtemp(prefix="ypkg-fused-strip-")
+    try:
+        install = os.path.join(tmp, "install")
+        for d in ["usr/lib64", "usr/bin"]:
+            os.makedirs(os.path.join(install, d))
+        for name, source in [("foo.c", LibSource), ("main.c", ProgSource)]:
+            with open(os.path.join(tmp, name), "w") as out:
+                out.write(source)
+
+        lib = os.path.join(install, "usr/lib64/libfoo.so.1")
+        prog = os.path.join(install, "usr/bin/prog")
+        prog_link = os.path.join(install, "usr/bin/prog-alias")
+        single = os.path.join(install, "usr/bin/single")
+        subprocess.check_call([gcc, "-g", "-shared", "-fPIC",
+                               "-Wl,-soname,libfoo.so.1", "-o", lib,
+                               os.path.join(tmp, "foo.c")])
+        for out in [prog, single]:
+            subprocess.check_call([gcc, "-g", "-o", out,
+                                   os.path.join(tmp, "main.c"), lib])
+        os.link(prog, prog_link)
+
+        ctx = Context(install, eu_strip)
+        problems = list()
+        for path, mode in [(lib, "shared"), (single, "executable")]:
+            pretty = "/" + os.path.relpath(path, install)
+            did = split_and_strip(ctx, pretty, path, ElfFile(path), mode,
+                                  ToolTimings())
+            if did is None:
+                problems.append("eu-strip failed on {}".format(pretty))
+                continue
+            problems.extend(check_stripped(path,
+                                           os.path.join(install, did[1:])))
+
+        # Hard links must fall back to the traditional backend untouched
+        did = split_and_strip(ctx, "/usr/bin/prog", prog, ElfFile(prog),
+                              "executable", ToolTimings())
+        if did is not None:
+            problems.append("hard linked /usr/bin/prog was fused")
+        if os.stat(prog).st_ino != os.stat(prog_link).st_ino:
+            problems.append("hard link of /usr/bin/prog was broken")
+        if not ElfFile(prog).has_symbols():
+            problems.append("hard linked /usr/bin/prog was stripped")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for problem in problems:
+        print(problem)
+    print("{} problems with {}".format(len(problems), eu_strip))
+    return 1 if len(problems) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
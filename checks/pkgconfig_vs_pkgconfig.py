@@ -0,0 +1,127 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Corpus check for the in-process pkg-config reader. Every .pc file found
+#  under the given directories, i.e. an install tree, is read with
+#  PkgConfigFile and the Requires and Requires.private lists compared with
+#  pkg-config --print-requires and --print-requires-private. Modules are
+#  resolved from the directories holding those files, then the host's own
+#  pkg-config search path.
+#
+#  Usage:
+#      pkgconfig_vs_pkgconfig.py           Check the host's search path
+#      pkgconfig_vs_pkgconfig.py DIR ...   Check the .pc files under DIR
+#
+
+import argparse
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from distutils.spawn import find_executable  # noqa: E402
+from ypkg2 import DEFAULTPC  # noqa: E402
+from ypkg2.pkgconfig import PkgConfigFile, PkgConfigError  # noqa: E402
+
+
+def find_files(dirs):
+    """ Return every .pc file under the given directories """
+    ret = list()
+    for top in dirs:
+        for root, subdirs, files in os.walk(top):
+            ret.extend(os.path.join(root, x) for x in sorted(files)
+                       if x.endswith(".pc"))
+    return ret
+
+
+def get_host_path():
+    """ The host's own search path, as DEFAULTPC is only the Solus one """
+    try:
+        out = subprocess.check_output(["pkg-config", "--variable", "pc_path",
+                                       "pkg-config"])
+    except Exception as e:
+        return DEFAULTPC
+    return out.strip() or DEFAULTPC
+
+
+def format_modules(modules):
+    """ Format parsed modules the same way pkg-config prints them """
+    ret = list()
+    for name, op, version in modules:
+        if op is None:
+            ret.append(name)
+        else:
+            ret.append("{} {} {}".format(name, op, version))
+    return ret
+
+
+def run_pkgconfig(path, search_path, flag):
+    env = dict(os.environ)
+    env["PKG_CONFIG_PATH"] = search_path
+    out = subprocess.check_output(["pkg-config", flag, path], env=env,
+                                  stderr=open(os.devnull, "w"))
+    return [x.strip() for x in out.split("\n") if x.strip() != ""]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PkgConfigFile "
+                                     "with pkg-config over a corpus of .pc "
+                                     "files")
+    parser.add_argument("dirs", nargs="*",
+                        help="Directories to search for .pc files")
+    args = parser.parse_args()
+
+    if find_executable("pkg-config") is None:
+        print("pkg-config not found, skipping")
+        return 0
+
+    host_path = get_host_path()
+    files = find_files(args.dirs or host_path.split(":"))
+    search_dirs = list()
+    for path in files:
+        if os.path.dirname(path) not in search_dirs:
+            search_dirs.append(os.path.dirname(path))
+    search_path = ":".join(search_dirs + [host_path])
+
+    checked = 0
+    failures = 0
+    for path in files:
+        try:
+            theirs = [run_pkgconfig(path, search_path, "--print-requires"),
+                      run_pkgconfig(path, search_path,
+                                    "--print-requires-private")]
+        except Exception as e:
+            # pkg-config rejected it, i.e. missing dependencies
+            continue
+        checked += 1
+        try:
+            pc = PkgConfigFile(path, search_path)
+        except PkgConfigError as e:
+            print("{}: {}".format(path, e))
+            failures += 1
+            continue
+        ours = [format_modules(pc.requires),
+                format_modules(pc.requires_private)]
+        for i, field in enumerate(["Requires", "Requires.private"]):
+            if ours[i] == theirs[i]:
+                continue
+            print("{}: {} differs\n    ours:       {}\n    pkg-config: {}".
+                  format(path, field, ours[i], theirs[i]))
+            failures += 1
+
+    print("{} files checked, {} differences".format(checked, failures))
+    return 1 if failures > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,17 @@
 #!/bin/bash
 
-pep8 ypkg-build ypkg2/*.py ypkg-gen-history ypkg-install-deps ypkg || exit 1
+pep8 ypkg-build ypkg2/*.py ypkg-gen-history ypkg-install-deps ypkg benchmarks/*.py checks/*.py || exit 1
+
+# Skips itself when eu-strip isn't installed
+python2 checks/fused_strip.py || exit 1
+
 #for item in examples/*.yml ; do
 #    python -m ypkg2.main $item || exit 1
 #done
 
 fakeroot ./ypkg-build examples/nano.yml || exit 1
+
+# Compare our ELF and pkg-config readers with the real tools over the result
+installdir="$HOME/YPKG/root/nano/install"
+python2 checks/elf_vs_readelf.py "$installdir" || exit 1
+python2 checks/pkgconfig_vs_pkgconfig.py "$installdir" || exit 1
@@ -40,3 +40,4 @@ packager_name = "Automated Package Build"
 packager_email = "no.email.set.in.config"
 
 EMUL32PC = "/usr/lib32/pkgconfig:/usr/share/pkgconfig:/usr/lib/pkgconfig"
+DEFAULTPC = "/usr/lib64/pkgconfig:/usr/share/pkgconfig"
@@ -0,0 +1,163 @@
+#!/bin/true
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+
+from . import console_ui
+
+import os
+import subprocess
+import time
+import multiprocessing.pool
+from distutils.spawn import find_executable
+
+# Debug trees packaged into the dbginfo packages
+DebugRoots = ["/usr/lib64/debug", "/usr/lib/debug", "/usr/lib32/debug"]
+
+
+def run_tool(cmd, cwd=None):
+    """ Run a tool directly, returning the output on failure, or None """
+    try:
+        p = subprocess.Popen(cmd, cwd=cwd, env={"LC_ALL": "C"},
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        out, err = p.communicate()
+    except Exception as e:
+        return str(e)
+    if p.returncode != 0:
+        return out.strip()
+    return None
+
+
+def compress_file(objcopy, path):
+    """ Compress the DWARF sections of a single file in place """
+    return run_tool([objcopy, "--compress-debug-sections=zlib-gabi", path])
+
+
+class DebugOptimizer:
+    """ Optional post-processing of the split debug files, shrinking the
+        dbginfo packages before they're hashed and compressed:
+
+            - dwz: multi-file DWARF deduplication across the whole build
+            - compressdebug: SHF_COMPRESSED DWARF sections, in place
+
+        dwz always runs first, as it must see the uncompressed DWARF. """
+
+    context = None
+    dwz = None
+    objcopy = None
+
+    def __init__(self, context):
+        self.context = context
+
+    def collect(self, root):
+        """ Collect all debug files within the given debug root, relative to
+            that root """
+        ret = list()
+        for dirpath, dirs, files in os.walk(root):
+            if ".dwz" in dirs:
+                dirs.remove(".dwz")
+            for f in files:
+                fpath = os.path.join(dirpath, f)
+                if not f.endswith(".debug") or os.path.islink(fpath):
+                    continue
+                ret.append(os.path.relpath(fpath, root))
+        return sorted(ret)
+
+    def get_size(self, root, files):
+        return sum([os.path.getsize(os.path.join(root, x)) for x in files])
+
+    def get_multifile_name(self):
+        spec = self.context.spec
+        return "{}-{}-{}.debug".format(spec.pkg_name, spec.pkg_version,
+                                       spec.pkg_release)
+
+    def run_dwz(self, root, files):
+        """ Deduplicate DWARF across all of the files, moving the common
+            bits into a .dwz multifile. Returns the new file list. """
+        cmd = [self.dwz, "-h", "-q", "-r"]
+        multi = None
+        if len(files) > 1:
+            multi = os.path.join(".dwz", self.get_multifile_name())
+            dwz_dir = os.path.join(root, ".dwz")
+            if not os.path.exists(dwz_dir):
+                os.makedirs(dwz_dir, mode=00755)
+            cmd.extend(["-m", multi])
+        cmd.extend(files)
+
+        err = run_tool(cmd, cwd=root)
+        if err:
+            # dwz carries on past files it can't handle
+            console_ui.emit_warning("Debug", "dwz: Not all files were "
+                                    "processed")
+            print(err)
+        if multi is not None and os.path.exists(os.path.join(root, multi)):
+            return files + [multi]
+        return files
+
+    def compress(self, root, files):
+        """ Compress the DWARF sections of every file in parallel """
+        objcopy = self.objcopy
+        paths = [os.path.join(root, x) for x in files]
+        jobs = max(self.context.build.jobcount, 1)
+        pool = multiprocessing.pool.ThreadPool(jobs)
+        try:
+            errors = pool.map(lambda x: compress_file(objcopy, x),
+                              paths)
+        finally:
+            pool.close()
+            pool.join()
+        for path, err in zip(files, errors):
+            if err is None:
+                continue
+            console_ui.emit_warning("Debug", "Failed to compress {}".
+                                    format(path))
+            print(err)
+
+    def run_step(self, name, root, files, func):
+        """ Run a single step, reporting the time spent and bytes saved """
+        before = self.get_size(root, files)
+        start = time.time()
+        ret = func(root, files)
+        if ret is not None:
+            files = ret
+        elapsed = time.time() - start
+        after = self.get_size(root, files)
+        console_ui.emit_info("Debug", "{}: saved {} bytes of {} in {:.2f}s".
+                             format(name, before - after, before, elapsed))
+        return files
+
+    def optimize(self):
+        """ Run every enabled step over each debug tree """
+        spec = self.context.spec
+        if spec.pkg_dwz:
+            self.dwz = find_executable("dwz")
+            if self.dwz is None:
+                console_ui.emit_warning("Debug", "dwz not found, skipping")
+        if spec.pkg_compressdebug:
+            self.objcopy = find_executable("objcopy")
+            if self.objcopy is None:
+                console_ui.emit_warning("Debug", "objcopy not found, "
+                                        "skipping compressdebug")
+        if self.dwz is None and self.objcopy is None:
+            return
+
+        install_dir = self.context.get_install_dir()
+        for droot in DebugRoots:
+            root = os.path.join(install_dir, droot[1:])
+            if not os.path.exists(root):
+                continue
+            files = self.collect(root)
+            if len(files) == 0:
+                continue
+            if self.dwz is not None:
+                files = self.run_step("dwz", root, files, self.run_dwz)
+            if self.objcopy is not None:
+                self.run_step("compressdebug", root, files, self.compress)
@@ -12,9 +12,12 @@
 #
 
 from . import console_ui
+from .providerindex import ProviderIndex
+from .providerindex import get_package_stamps, get_installdb_stamp
 from pisi.db.installdb import InstallDB
 from pisi.db.packagedb import PackageDB
 from pisi.db.filesdb import FilesDB
+from collections import OrderedDict
 import os
 
 
@@ -37,6 +40,126 @@ ExceptionRules = [
     "libglx.so.1",
 ]
 
+# Directories searched for libraries by default
+LibraryDirs = ["/usr/lib64", "/usr/lib", "/usr/lib32"]
+
+# Maximum number of library paths remembered by the resolver
+LIBRARY_CACHE_SIZE = 8192
+
+
+class LibraryCache:
+    """ Bounded LRU cache mapping library paths to their providers. Only
+        shared objects within library directories are remembered, so the
+        memory used stays flat regardless of the size of the packages that
+        are depended upon. """
+
+    entries = None
+    limit = 0
+
+    hits = 0
+    misses = 0
+
+    def __init__(self, limit=LIBRARY_CACHE_SIZE):
+        self.entries = OrderedDict()
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, path):
+        """ Return the cached provider of the path, or None on a miss """
+        pkg = self.entries.pop(path, None)
+        if pkg is None:
+            self.misses += 1
+            return None
+        self.entries[path] = pkg
+        self.hits += 1
+        return pkg
+
+    def add(self, path, pkg):
+        self.entries.pop(path, None)
+        self.entries[path] = pkg
+        while len(self.entries) > self.limit:
+            self.entries.popitem(last=False)
+
+    def add_package(self, pkg, files, dirs):
+        """ Remember the libraries within dirs from a package's files """
+        for file in files:
+            fpath = "/" + file.path
+            if os.path.dirname(fpath) not in dirs:
+                continue
+            if not ProviderIndex.is_library(fpath):
+                continue
+            self.add(fpath, pkg)
+
+
+class ProviderCache:
+    """ Cache of the external providers found by a resolver. It may be
+        shared between several resolvers in one long lived process, and is
+        cleared whenever the InstallDB changes. """
+
+    # Binary dependencies, and pkgconfig names, for each architecture
+    Kinds = ["bindeps", "bindeps_emul32", "pkgconfig", "pkgconfig32"]
+
+    stamp = None
+    caches = None
+    libraries = None
+
+    hits = None
+    misses = None
+    invalidations = 0
+
+    def __init__(self, library_limit=LIBRARY_CACHE_SIZE):
+        self.caches = dict((x, dict()) for x in self.Kinds)
+        self.libraries = LibraryCache(library_limit)
+        self.hits = dict((x, 0) for x in self.Kinds)
+        self.misses = dict((x, 0) for x in self.Kinds)
+        self.invalidations = 0
+
+    def invalidate(self):
+        """ Forget every provider, keeping the statistics """
+        for kind in self.Kinds:
+            self.caches[kind].clear()
+        self.libraries.entries.clear()
+        self.invalidations += 1
+
+    def validate(self, stamp):
+        """ Invalidate the cache if the InstallDB stamp has changed """
+        if self.stamp is not None and self.stamp != stamp:
+            self.invalidate()
+        self.stamp = stamp
+
+    def get(self, kind, key):
+        """ Return the cached provider, or None on a miss """
+        ret = self.caches[kind].get(key)
+        if ret is None:
+            self.misses[kind] += 1
+        else:
+            self.hits[kind] += 1
+        return ret
+
+    def set(self, kind, key, value):
+        self.caches[kind][key] = value
+
+    def get_stats(self):
+        """ Hits, misses and size of each cache, for monitoring """
+        ret = dict()
+        for kind in self.Kinds:
+            ret[kind] = {
+                "hits": self.hits[kind],
+                "misses": self.misses[kind],
+                "size": len(self.caches[kind]),
+            }
+        ret["libraries"] = {
+            "hits": self.libraries.hits,
+            "misses": self.libraries.misses,
+            "size": len(self.libraries),
+        }
+        ret["invalidations"] = self.invalidations
+        return ret
+
 
 class DependencyResolver:
 
@@ -44,30 +167,56 @@ class DependencyResolver:
     pdb = None
     fdb = None
 
-    global_rpaths = set()
-    global_sonames = dict()
-    global_pkgconfigs = dict()
-    global_pkgconfig32s = dict()
+    global_rpaths = None
+    global_sonames = None
+    global_pkgconfigs = None
+    global_pkgconfig32s = None
     gene = None
 
-    bindeps_cache = dict()
-    bindeps_emul32 = dict()
-
-    pkgconfig_cache = dict()
-    pkgconfig32_cache = dict()
+    # External providers, possibly shared with other resolvers
+    cache = None
 
-    files_cache = dict()
+    # Persistent index of the installed providers, if it could be opened
+    index = None
 
     def search_file(self, fname):
         if fname[0] == '/':
             fname = fname[1:]
         return self.fdb.search_file(fname)
 
-    def __init__(self):
-        """ Allows us to do look ups on all packages """
+    def __init__(self, cache=None):
+        """ Allows us to do look ups on all packages. A ProviderCache may be
+            given to share external providers with other resolvers """
         self.idb = InstallDB()
         self.pdb = PackageDB()
         self.fdb = FilesDB()
+        if cache is None:
+            cache = ProviderCache()
+        self.cache = cache
+
+    def open_index(self, context, stamps):
+        """ Open and refresh the provider index, falling back to searching
+            the databases directly if that isn't possible """
+        try:
+            self.index = ProviderIndex(context.get_provider_index_path(),
+                                       self.idb)
+            self.index.refresh(stamps)
+        except Exception as e:
+            console_ui.emit_warning("Index", "Cannot use provider index: {}".
+                                    format(e))
+            self.index = None
+
+    def get_installed_pkgconfig(self, name, emul32=False):
+        """ Get the name of the installed provider of a pkgconfig name """
+        if self.index is not None:
+            return self.index.get_pkgconfig_provider(name, emul32)
+        if emul32:
+            pkg = self.idb.get_package_by_pkgconfig32(name)
+        else:
+            pkg = self.idb.get_package_by_pkgconfig(name)
+        if not pkg:
+            return None
+        return pkg.name
 
     def get_symbol_provider(self, symbol):
         """ Grab the symbol from the local packages """
@@ -87,12 +236,10 @@ class DependencyResolver:
             i.e. installed binary dependencies
         """
         # Try a cached approach first.
-        if info.emul32:
-            if symbol in self.bindeps_emul32:
-                return self.bindeps_emul32[symbol]
-        else:
-            if symbol in self.bindeps_cache:
-                return self.bindeps_cache[symbol]
+        kind = "bindeps_emul32" if info.emul32 else "bindeps"
+        cached = self.cache.get(kind, symbol)
+        if cached:
+            return cached
 
         if symbol in ExceptionRules:
             if info.emul32:
@@ -111,27 +258,30 @@ class DependencyResolver:
         pkg = None
         for path in paths:
             fpath = os.path.join(path, symbol)
-            lpkg = None
-            if fpath in self.files_cache:
-                lpkg = self.files_cache[fpath]
-            else:
-                pkg = self.search_file(fpath)
-                if pkg:
-                    lpkg = pkg[0][0]
-            if lpkg:
-                if info.emul32:
-                    self.bindeps_emul32[symbol] = lpkg
+            lpkg = self.cache.libraries.get(fpath)
+            if lpkg is None:
+                if self.index is not None and \
+                        ProviderIndex.is_library(fpath):
+                    lpkg = self.index.get_library_provider(fpath)
                 else:
-                    self.bindeps_cache[symbol] = lpkg
+                    pkg = self.search_file(fpath)
+                    if pkg:
+                        lpkg = pkg[0][0]
+            if lpkg:
+                self.cache.set(kind, symbol, lpkg)
                 console_ui.emit_info("Dependency",
                                      "{} adds dependency on {} from {}".
                                      format(info.pretty, symbol, lpkg))
 
-                # Populate a global files cache, basically there is a high
-                # chance that each package depends on multiple things in a
-                # single package.
-                for file in self.idb.get_files(lpkg).list:
-                    self.files_cache["/" + file.path] = lpkg
+                # There is a high chance that each package depends on
+                # multiple libraries in a single package. The index already
+                # answers those quickly, so only prefetch without it.
+                self.cache.libraries.add(fpath, lpkg)
+                if self.index is None:
+                    dirs = set([os.path.normpath(x)
+                                for x in LibraryDirs + paths])
+                    self.cache.libraries.add_package(
+                        lpkg, self.idb.get_files(lpkg).list, dirs)
                 return lpkg
         return None
 
@@ -150,41 +300,72 @@ class DependencyResolver:
         pkg = None
 
         if info.emul32:
-            if name in self.pkgconfig32_cache:
-                return self.pkgconfig32_cache[name]
-        if name in self.pkgconfig_cache:
-            return self.pkgconfig_cache[name]
+            pkg = self.cache.get("pkgconfig32", name)
+            if pkg:
+                return pkg
+        pkg = self.cache.get("pkgconfig", name)
+        if pkg:
+            return pkg
 
         if info.emul32:
-            pkg = self.idb.get_package_by_pkgconfig32(name)
+            pkg = self.get_installed_pkgconfig(name, True)
             if not pkg:
-                pkg = self.idb.get_package_by_pkgconfig(name)
+                pkg = self.get_installed_pkgconfig(name)
             if not pkg:
                 pkg = self.pdb.get_package_by_pkgconfig32(name)
+                pkg = pkg.name if pkg else None
             if not pkg:
                 pkg = self.pdb.get_package_by_pkgconfig(name)
+                pkg = pkg.name if pkg else None
         else:
-            pkg = self.idb.get_package_by_pkgconfig(name)
+            pkg = self.get_installed_pkgconfig(name)
             if not pkg:
                 pkg = self.pdb.get_package_by_pkgconfig(name)
+                pkg = pkg.name if pkg else None
 
         if not pkg:
             return None
         if info.emul32:
-            self.pkgconfig32_cache[name] = pkg.name
+            self.cache.set("pkgconfig32", name, pkg)
         else:
-            self.pkgconfig_cache[name] = pkg.name
-        return pkg.name
-
-    def handle_binary_deps(self, packageName, info):
-        """ Handle direct binary dependencies """
-        for sym in info.symbol_deps:
+            self.cache.set("pkgconfig", name, pkg)
+        return pkg
+
+    def get_symbol_key(self, info, symbol):
+        """ Everything affecting the resolution of a binary dependency """
+        rpaths = frozenset(info.rpaths) if info.rpaths else None
+        return (symbol, info.emul32, rpaths)
+
+    def resolve_binary_deps(self):
+        """ Resolve every unique binary dependency across all packages in
+            one batch, returning a mapping of each key to its provider """
+        requests = OrderedDict()
+        for packageName in self.packageSet:
+            for info in self.packageSet[packageName]:
+                if not info.symbol_deps:
+                    continue
+                for sym in info.symbol_deps:
+                    key = self.get_symbol_key(info, sym)
+                    if key not in requests:
+                        requests[key] = info
+
+        resolved = dict()
+        for key, info in requests.items():
+            sym = key[0]
             r = self.get_symbol_provider(sym)
             if not r:
                 r = self.get_symbol_external(info, sym)
                 if not r:
                     print("Fatal: Unknown symbol: {}".format(sym))
-                    continue
+            resolved[key] = r
+        return resolved
+
+    def handle_binary_deps(self, packageName, info, resolved):
+        """ Handle direct binary dependencies """
+        for sym in info.symbol_deps:
+            r = resolved[self.get_symbol_key(info, sym)]
+            if not r:
+                continue
             self.gene.packages[packageName].depend_packages.add(r)
 
     def handle_pkgconfig_deps(self, packageName, info):
@@ -245,6 +426,16 @@ class DependencyResolver:
         self.packageSet = packageSet
         self.ctx = context
 
+        # Anything installed since the last use invalidates the cache
+        stamps = get_package_stamps(self.idb)
+        self.cache.validate(get_installdb_stamp(stamps))
+        self.open_index(context, stamps)
+
+        self.global_rpaths = set()
+        self.global_sonames = dict()
+        self.global_pkgconfigs = dict()
+        self.global_pkgconfig32s = dict()
+
         # First iteration, collect the globals
         for packageName in packageSet:
             for info in packageSet[packageName]:
@@ -259,11 +450,19 @@ class DependencyResolver:
                     else:
                         self.global_pkgconfigs[pcName] = packageName
 
+        # Resolve each unique binary dependency once
+        resolved = self.resolve_binary_deps()
+        stats = self.cache.get_stats()["libraries"]
+        console_ui.emit_info("Dependency", "Library cache: {} hits, {} "
+                             "misses, {} entries".format(stats["hits"],
+                                                         stats["misses"],
+                                                         stats["size"]))
+
         # Ok now find the dependencies
         for packageName in packageSet:
             for info in packageSet[packageName]:
                 if info.symbol_deps:
-                    self.handle_binary_deps(packageName, info)
+                    self.handle_binary_deps(packageName, info, resolved)
 
                 if info.pkgconfig_deps:
                     self.handle_pkgconfig_deps(packageName, info)
@@ -0,0 +1,385 @@
+#!/bin/true
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+
+import binascii
+import mmap
+import struct
+
+ELFMAG = b"\x7fELF"
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+
+SHN_XINDEX = 0xffff
+
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_DYNAMIC = 6
+SHT_NOTE = 7
+SHT_NOBITS = 8
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_NOTE = 4
+
+NT_GNU_BUILD_ID = 3
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+# Layouts for each ELF class, all little endian
+ElfLayouts = {
+    ELFCLASS32: {
+        "ehdr": struct.Struct("<HHIIIIIHHHHHH"),
+        "shdr": struct.Struct("<IIIIIIIIII"),
+        "phdr": struct.Struct("<IIIIIIII"),
+        "dyn": struct.Struct("<iI"),
+    },
+    ELFCLASS64: {
+        "ehdr": struct.Struct("<HHIQQQIHHHHHH"),
+        "shdr": struct.Struct("<IIQQQQIIQQ"),
+        "phdr": struct.Struct("<IIQQQQQQ"),
+        "dyn": struct.Struct("<qQ"),
+    },
+}
+
+# Note headers are the same size for both classes
+ElfNoteHeader = struct.Struct("<III")
+
+
+def get_header_type(header):
+    """ Return the object type (e_type) from the first bytes of a file, or
+        None if it isn't an ELF object we're able to handle """
+    if len(header) < 18 or header[0:4] != ELFMAG:
+        return None
+    if ord(header[4:5]) not in ElfLayouts:
+        return None
+    if ord(header[5:6]) != ELFDATA2LSB:
+        return None
+    return struct.unpack_from("<H", header, 16)[0]
+
+
+def read_header_type(path):
+    """ Read just enough of the given path to determine its object type """
+    try:
+        with open(path, "rb") as infile:
+            return get_header_type(infile.read(18))
+    except Exception as e:
+        return None
+
+
+class ElfError(Exception):
+    """ Raised when a file cannot be parsed as a supported ELF object """
+    pass
+
+
+class ElfSection:
+
+    name = None
+    type = None
+    flags = None
+    addr = None
+    offset = None
+    size = None
+    link = None
+
+    def __init__(self, shdr):
+        (self.name_offset, self.type, self.flags, self.addr, self.offset,
+         self.size, self.link, self.info, self.addralign,
+         self.entsize) = shdr
+
+
+class ElfSegment:
+
+    type = None
+    offset = None
+    vaddr = None
+    filesz = None
+
+    def __init__(self, elf_class, phdr):
+        if elf_class == ELFCLASS64:
+            (self.type, self.flags, self.offset, self.vaddr, self.paddr,
+             self.filesz, self.memsz, self.align) = phdr
+        else:
+            (self.type, self.offset, self.vaddr, self.paddr, self.filesz,
+             self.memsz, self.flags, self.align) = phdr
+
+
+class ElfNote:
+
+    name = None
+    type = None
+    desc = None
+
+    def __init__(self, name, type, desc):
+        self.name = name
+        self.type = type
+        self.desc = desc
+
+
+class ElfFile:
+    """ Minimal in-process ELF reader, supporting 32-bit and 64-bit LSB
+        objects. This only reads the bits ypkg cares about, i.e. what we
+        would otherwise scrape from `readelf -d` and `readelf -n`, without
+        the cost of spawning a process for every single binary.
+
+        Everything is parsed once up front, so a single instance can be
+        shared by all stages examining the file. """
+
+    path = None
+    elf_class = None
+    elf_type = None
+    machine = None
+
+    sections = None
+    segments = None
+    notes = None
+
+    needed = None
+    rpaths = None
+    runpaths = None
+    soname = None
+
+    def __init__(self, path):
+        self.path = path
+        self.sections = list()
+        self.segments = list()
+        self.notes = list()
+        self.needed = list()
+        self.rpaths = list()
+        self.runpaths = list()
+
+        with open(path, "rb") as infile:
+            try:
+                data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+            except Exception as e:
+                raise ElfError("Cannot map {}: {}".format(path, e))
+        try:
+            self.parse(data)
+        except struct.error as e:
+            raise ElfError("Truncated ELF file {}: {}".format(path, e))
+        finally:
+            data.close()
+
+    def parse(self, data):
+        """ Parse all the interesting bits up front, so that the mapping can
+            be released immediately afterwards """
+        if data[0:4] != ELFMAG:
+            raise ElfError("Not an ELF file: {}".format(self.path))
+        elf_class = ord(data[4:5])
+        if elf_class not in ElfLayouts:
+            raise ElfError("Unknown ELF class: {}".format(self.path))
+        if ord(data[5:6]) != ELFDATA2LSB:
+            raise ElfError("Only LSB objects are supported: {}".
+                           format(self.path))
+        self.elf_class = elf_class
+        self.layout = ElfLayouts[elf_class]
+
+        (self.elf_type, self.machine, version, entry, phoff, shoff, flags,
+         ehsize, phentsize, phnum, shentsize, shnum,
+         shstrndx) = self.layout["ehdr"].unpack_from(data, 16)
+
+        self.parse_sections(data, shoff, shentsize, shnum, shstrndx)
+        self.parse_segments(data, phoff, phentsize, phnum)
+        self.parse_notes(data)
+        self.parse_dynamic(data)
+
+    def is_32bit(self):
+        """ Determine if this is a 32-bit object """
+        return self.elf_class == ELFCLASS32
+
+    def is_shared(self):
+        """ Shared objects, including PIE executables """
+        return self.elf_type == ET_DYN
+
+    def is_executable(self):
+        return self.elf_type == ET_EXEC
+
+    def is_relocatable(self):
+        return self.elf_type == ET_REL
+
+    def get_section_names(self):
+        """ Return the names of all sections in this object """
+        return [x.name for x in self.sections if x.name]
+
+    def has_symbols(self):
+        """ Determine if this object has anything left for strip to remove,
+            i.e. a symbol table or debug sections """
+        for sect in self.sections:
+            if sect.type == SHT_SYMTAB:
+                return True
+            if sect.name and sect.name.startswith((b".debug", b".zdebug")):
+                return True
+        return False
+
+    def get_build_id(self):
+        """ Return the NT_GNU_BUILD_ID as a hex string, if present """
+        for note in self.notes:
+            if note.type == NT_GNU_BUILD_ID and note.name == b"GNU":
+                return binascii.hexlify(note.desc).decode("ascii")
+        return None
+
+    def parse_sections(self, data, shoff, shentsize, shnum, shstrndx):
+        """ Read the section header table, if there is one """
+        if shoff == 0:
+            return
+        shdr = self.layout["shdr"]
+        if shentsize != shdr.size:
+            raise ElfError("Bad section header size: {}".format(self.path))
+
+        # Large section counts live in the initial section header
+        if shnum == 0 or shstrndx == SHN_XINDEX:
+            first = ElfSection(shdr.unpack_from(data, shoff))
+            if shnum == 0:
+                shnum = first.size
+            if shstrndx == SHN_XINDEX:
+                shstrndx = first.link
+
+        for i in range(0, shnum):
+            sect = ElfSection(shdr.unpack_from(data, shoff + i * shentsize))
+            self.sections.append(sect)
+
+        if shstrndx >= len(self.sections):
+            return
+        strtab = self.sections[shstrndx]
+        for sect in self.sections:
+            sect.name = self.read_string(data, strtab.offset, strtab.size,
+                                         sect.name_offset)
+
+    def parse_segments(self, data, phoff, phentsize, phnum):
+        """ Read the program header table, if there is one """
+        if phoff == 0:
+            return
+        phdr = self.layout["phdr"]
+        if phentsize != phdr.size:
+            raise ElfError("Bad program header size: {}".format(self.path))
+        for i in range(0, phnum):
+            seg = ElfSegment(self.elf_class,
+                             phdr.unpack_from(data, phoff + i * phentsize))
+            self.segments.append(seg)
+
+    def parse_notes(self, data):
+        """ Collect all notes, from SHT_NOTE sections, or PT_NOTE segments
+            when the section headers are missing """
+        regions = list()
+        for sect in self.sections:
+            if sect.type == SHT_NOTE:
+                regions.append((sect.offset, sect.size, sect.addralign))
+        if len(regions) == 0:
+            for seg in self.segments:
+                if seg.type == PT_NOTE:
+                    regions.append((seg.offset, seg.filesz, seg.align))
+
+        for offset, size, align in regions:
+            # Notes are 4 byte aligned, except for 8 byte aligned sections
+            align = 8 if align == 8 else 4
+            end = offset + size
+            while offset + ElfNoteHeader.size <= end:
+                namesz, descsz, ntype = ElfNoteHeader.unpack_from(data,
+                                                                  offset)
+                offset += ElfNoteHeader.size
+                name = data[offset:offset + namesz].rstrip(b"\0")
+                offset += (namesz + align - 1) & ~(align - 1)
+                desc = data[offset:offset + descsz]
+                offset += (descsz + align - 1) & ~(align - 1)
+                self.notes.append(ElfNote(name, ntype, desc))
+
+    def vaddr_to_offset(self, vaddr):
+        """ Map a virtual address back to a file offset via PT_LOAD """
+        for seg in self.segments:
+            if seg.type != PT_LOAD:
+                continue
+            if seg.vaddr <= vaddr < seg.vaddr + seg.filesz:
+                return vaddr - seg.vaddr + seg.offset
+        return None
+
+    def parse_dynamic(self, data):
+        """ Collect DT_NEEDED, DT_RPATH, DT_RUNPATH and DT_SONAME, preferring
+            the section headers exactly as readelf does, and falling back to
+            PT_DYNAMIC for objects with their section headers stripped. """
+        dyn_offset = None
+        dyn_size = None
+        str_offset = None
+        str_size = None
+
+        for sect in self.sections:
+            if sect.type != SHT_DYNAMIC:
+                continue
+            dyn_offset = sect.offset
+            dyn_size = sect.size
+            if sect.link < len(self.sections):
+                strtab = self.sections[sect.link]
+                if strtab.type == SHT_STRTAB:
+                    str_offset = strtab.offset
+                    str_size = strtab.size
+            break
+
+        # A NOBITS .dynamic, as in split debug files, means there is none
+        if dyn_offset is None and len(self.sections) == 0:
+            for seg in self.segments:
+                if seg.type != PT_DYNAMIC:
+                    continue
+                dyn_offset = seg.offset
+                dyn_size = seg.filesz
+                break
+
+        if dyn_offset is None:
+            return
+
+        dyn = self.layout["dyn"]
+        entries = list()
+        for i in range(0, dyn_size // dyn.size):
+            tag, val = dyn.unpack_from(data, dyn_offset + i * dyn.size)
+            if tag == DT_NULL:
+                break
+            entries.append((tag, val))
+            if tag == DT_STRTAB and str_offset is None:
+                str_offset = self.vaddr_to_offset(val)
+                str_size = len(data) - str_offset \
+                    if str_offset is not None else None
+
+        if str_offset is None:
+            raise ElfError("No dynamic string table: {}".format(self.path))
+
+        for tag, val in entries:
+            if tag == DT_NEEDED:
+                self.needed.append(self.read_string(data, str_offset,
+                                                    str_size, val))
+            elif tag == DT_RPATH:
+                self.rpaths.append(self.read_string(data, str_offset,
+                                                    str_size, val))
+            elif tag == DT_RUNPATH:
+                self.runpaths.append(self.read_string(data, str_offset,
+                                                      str_size, val))
+            elif tag == DT_SONAME:
+                self.soname = self.read_string(data, str_offset, str_size,
+                                               val)
+
+    def read_string(self, data, table_offset, table_size, index):
+        """ Read a NUL terminated string from a string table """
+        if index >= table_size:
+            raise ElfError("String index out of range: {}".format(self.path))
+        start = table_offset + index
+        end = data.find(b"\0", start, table_offset + table_size)
+        if end < 0:
+            end = table_offset + table_size
+        return data[start:end]
@@ -14,26 +14,52 @@
 from . import console_ui
 from .metadata import readlink
 from . import remove_prefix
-from . import EMUL32PC
+from . import EMUL32PC, DEFAULTPC
+from .elf import ElfFile, ET_DYN, ET_EXEC, ET_REL
+from .elf import get_header_type, read_header_type
+from .examinecache import ExaminationCache
+from .pkgconfig import PkgConfigFile
+from .timings import ToolTimings, ExamineTimings
 import magic
 import re
 import os
+import stat
+import copy
 import subprocess
+import time
 import shutil
 import multiprocessing
+import multiprocessing.pool
+from collections import OrderedDict
+from distutils.spawn import find_executable
 
-global share_ctx
 
+libtool_file = re.compile("libtool library file, ASCII text.*")
 
-v_dyn = re.compile(r"ELF (64|32)\-bit LSB shared object,")
-v_bin = re.compile(r"ELF (64|32)\-bit LSB executable,")
-v_rel = re.compile(r"ELF (64|32)\-bit LSB relocatable,")
-shared_lib = re.compile(r".*Shared library: \[(.*)\].*")
-r_path = re.compile(r".*Library rpath: \[(.*)\].*")
-r_soname = re.compile(r".*Library soname: \[(.*)\].*")
+# libmagic looks for this within the first 80 bytes of a libtool file
+LIBTOOL_MARKER = b".la - a libtool library file"
+LIBTOOL_SEARCH = 80
+LIBTOOL_MAX_SIZE = 64 * 1024
 
+AR_MAGIC = b"!<arch>\n"
 
-def is_pkgconfig_file(pretty, mgs):
+# Enough to identify everything we care about without libmagic
+HEADER_SIZE = 128
+
+
+class FileKind:
+    """ Classification of an installed file """
+
+    OTHER = 0
+    ELF = 1
+    AR = 2
+    PKGCONFIG = 3
+    LIBTOOL = 4
+    SYMLINK = 5
+    DIRECTORY = 6
+
+
+def is_pkgconfig_file(pretty):
     """ Simple as it sounds, work out if this is a pkgconfig file """
     if pretty.endswith(".pc"):
         pname = os.path.basename(os.path.dirname(pretty))
@@ -42,7 +68,7 @@ def is_pkgconfig_file(pretty, mgs):
     return False
 
 
-def is_soname_link(file, mgs):
+def is_soname_link(file):
     """ Used to detect soname links """
     if not file.endswith(".so"):
         return False
@@ -52,6 +78,156 @@ def is_soname_link(file, mgs):
     return False
 
 
+class FileClassifier:
+    """ Classify files from their path and a small header read, handling the
+        common cases without libmagic. Only files we cannot decide on (such
+        as a libtool marker in a non ASCII file) are passed to a single,
+        reused libmagic cookie. """
+
+    cookie = None
+
+    # Statistics
+    classified = 0
+    magic_calls = 0
+    timings = None
+
+    def __init__(self):
+        self.cookie = None
+        self.classified = 0
+        self.magic_calls = 0
+        self.timings = ToolTimings()
+
+    def classify(self, pretty, file):
+        """ Return the FileKind for the given file, or None on error """
+        self.classified += 1
+
+        if is_pkgconfig_file(pretty):
+            return FileKind.PKGCONFIG
+        try:
+            st = os.lstat(file)
+        except Exception as e:
+            print(e)
+            return None
+        if stat.S_ISLNK(st.st_mode):
+            return FileKind.SYMLINK
+        if stat.S_ISDIR(st.st_mode):
+            return FileKind.DIRECTORY
+        if not stat.S_ISREG(st.st_mode):
+            return FileKind.OTHER
+
+        try:
+            with open(file, "rb") as infile:
+                header = infile.read(HEADER_SIZE)
+        except Exception as e:
+            return self.classify_magic(file)
+
+        if header[0:4] == b"\x7fELF":
+            if get_header_type(header) in [ET_DYN, ET_EXEC, ET_REL]:
+                return FileKind.ELF
+            return FileKind.OTHER
+        if header.startswith(AR_MAGIC):
+            return FileKind.AR
+
+        idx = header.find(LIBTOOL_MARKER)
+        if idx < 0 or idx >= LIBTOOL_SEARCH:
+            return FileKind.OTHER
+
+        # libmagic must also agree that this is plain ASCII text, which
+        # libtool files always are. Anything else is left to libmagic.
+        try:
+            with open(file, "rb") as infile:
+                content = infile.read(LIBTOOL_MAX_SIZE + 1)
+            if len(content) > LIBTOOL_MAX_SIZE or b"\0" in content:
+                return self.classify_magic(file)
+            content.decode("ascii")
+        except Exception as e:
+            return self.classify_magic(file)
+        return FileKind.LIBTOOL
+
+    def classify_magic(self, file):
+        """ Fall back to libmagic for anything ambiguous """
+        self.magic_calls += 1
+        start = time.time()
+        try:
+            if self.cookie is None:
+                self.cookie = magic.Magic()
+            mgs = self.cookie.from_file(file)
+        except Exception as e:
+            print(e)
+            return None
+        finally:
+            self.timings.add("libmagic", time.time() - start)
+        if libtool_file.match(mgs):
+            return FileKind.LIBTOOL
+        return FileKind.OTHER
+
+    def get_avoided(self):
+        """ Number of libmagic calls we managed to avoid """
+        return self.classified - self.magic_calls
+
+
+def get_tool_version(tool):
+    """ Return the first line of the tool's --version output, or None if it
+        cannot be run """
+    try:
+        out = subprocess.check_output([tool, "--version"],
+                                      stderr=open(os.devnull, "w"))
+    except Exception as e:
+        return None
+    return out.split("\n")[0].strip()
+
+
+class ExamineContext:
+    """ Picklable subset of the YpkgContext, holding only what is needed to
+        examine a single file. This is handed to each worker, as the full
+        context (and its pisi configuration) cannot be shared between
+        processes. """
+
+    install_dir = None
+    can_dbginfo = False
+
+    strip = True
+    autodep = True
+    optimize = None
+
+    # Examination cache, or None if disabled
+    cache_dir = None
+
+    # Path to eu-strip for the fused split and strip backend, if enabled
+    eu_strip = None
+
+    # Versions of the tools rewriting the files, part of every cache key
+    tool_versions = None
+
+    def __init__(self, context):
+        self.install_dir = context.get_install_dir()
+        self.can_dbginfo = context.can_dbginfo
+
+        self.strip = context.spec.pkg_strip
+        self.autodep = context.spec.pkg_autodep
+        self.optimize = context.spec.pkg_optimize
+
+        if context.build.examine_cache_size > 0:
+            self.cache_dir = context.get_examine_cache_dir()
+
+        # Fusing only makes sense when we'd be splitting *and* stripping
+        if context.spec.pkg_fusedstrip and self.strip and self.can_dbginfo:
+            self.eu_strip = find_executable("eu-strip")
+            if self.eu_strip is None:
+                console_ui.emit_warning("Strip", "eu-strip not found, "
+                                        "skipping fusedstrip")
+
+        if self.cache_dir is not None:
+            tools = ["strip", "objcopy"]
+            if self.eu_strip is not None:
+                tools.append(self.eu_strip)
+            self.tool_versions = [get_tool_version(x) for x in tools]
+
+    def get_install_dir(self):
+        """ Get the install directory for the package being examined """
+        return self.install_dir
+
+
 class FileReport:
 
     pkgconfig_deps = None
@@ -66,83 +242,47 @@ class FileReport:
 
     soname_links = None
 
-    def scan_binary(self, file, check_soname=False):
-        cmd = "LC_ALL=C /usr/bin/readelf -d \"{}\"".format(file)
-        try:
-            output = subprocess.check_output(cmd, shell=True)
-        except Exception as e:
+    def scan_binary(self, file, elf, check_soname=False):
+        if elf is None:
             console_ui.emit_warning("File", "Failed to scan binary deps for"
                                     " path: {}".format(file))
             return
 
-        for line in output.split("\n"):
-            line = line.strip()
+        # DT_RPATH and DT_RUNPATH are treated alike for resolution
+        for rpath in elf.rpaths + elf.runpaths:
+            if self.rpaths is None:
+                self.rpaths = set()
+            self.rpaths.add(rpath)
 
-            # Match rpath
-            r = r_path.match(line)
-            if r:
-                if self.rpaths is None:
-                    self.rpaths = set()
-                self.rpaths.add(r.group(1))
-                continue
-
-            # Match direct needed dependency
-            m = shared_lib.match(line)
-            if m:
-                if self.symbol_deps is None:
-                    self.symbol_deps = set()
-                self.symbol_deps.add(m.group(1))
-                continue
-
-            # Check the soname for this binary file
-            if check_soname:
-                so = r_soname.match(line)
-                if so:
-                    self.soname = so.group(1)
+        # Direct needed dependencies
+        for needed in elf.needed:
+            if self.symbol_deps is None:
+                self.symbol_deps = set()
+            self.symbol_deps.add(needed)
 
-    def scan_pkgconfig(self, file):
-        sub = ""
-        if self.emul32:
-            sub = "PKG_CONFIG_PATH=\"{}\" ".format(EMUL32PC)
-
-        cmds = [
-            "LC_ALL=C {}pkg-config --print-requires \"{}\"",
-            "LC_ALL=C {}pkg-config --print-requires-private \"{}\""
-        ]
+        # Check the soname for this binary file
+        if check_soname and elf.soname:
+            self.soname = elf.soname
 
+    def scan_pkgconfig(self, context, file):
         pcname = os.path.basename(file).split(".pc")[0]
         self.pkgconfig_name = pcname
 
-        if not share_ctx.spec.pkg_autodep:
+        if not context.autodep:
             return
-        for cmd in cmds:
-            try:
-                out = subprocess.check_output(cmd.format(sub, file),
-                                              shell=True)
-            except Exception as e:
-                print(e)
-                continue
-            for line in out.split("\n"):
-                line = line.strip()
+        search_path = EMUL32PC if self.emul32 else DEFAULTPC
+        try:
+            pc = PkgConfigFile(file, search_path)
+        except Exception as e:
+            print(e)
+            return
+        # In future we'll do something useful with versions
+        for name, op, version in pc.requires + pc.requires_private:
+            if not self.pkgconfig_deps:
+                self.pkgconfig_deps = set()
+            self.pkgconfig_deps.add(name)
 
-                if line == "":
-                    continue
-                name = None
-                # In future we'll do something useful with versions
-                if ">=" in line:
-                    name = line.split(">=")[0]
-                elif "=" in line:
-                    # This is an internal dependency
-                    name = line.split("=")[0]
-                else:
-                    name = line
-                name = name.strip()
-
-                if not self.pkgconfig_deps:
-                    self.pkgconfig_deps = set()
-                self.pkgconfig_deps.add(name)
-
-    def add_solink(self, file, pretty):
+    def add_solink(self, context, file, pretty):
         """ .so links are almost always split into -devel subpackages in ypkg,
             unless explicitly overriden. However, they are useless without the
             actual versioned so they link to. Therefore, we add an automatic
@@ -160,130 +300,372 @@ class FileReport:
         dirn = os.path.dirname(file)
         fobj = os.path.join(dirn, fpath)
 
-        try:
-            mg = magic.from_file(fobj)
-        except Exception as e:
-            return
-
-        if not v_dyn.match(mg):
+        if read_header_type(fobj) != ET_DYN:
             return
-        fpath = remove_prefix(fobj, share_ctx.get_install_dir())
+        fpath = remove_prefix(fobj, context.get_install_dir())
         if not self.soname_links:
             self.soname_links = set()
         self.soname_links.add(fpath)
 
-    def __init__(self, pretty, file, mgs):
-        global share_ctx
+    def clone(self, pretty, file):
+        """ Attribute this report to another path of the same ELF inode """
+        report = copy.deepcopy(self)
+        report.pretty = pretty
+        report.file = file
+        report.emul32 = pretty.startswith(("/usr/lib32/", "/lib32"))
+        return report
+
+    def __init__(self, context, pretty, file, kind, elf=None):
         self.pretty = pretty
         self.file = file
 
         if pretty.startswith("/usr/lib32/") or pretty.startswith("/lib32"):
             self.emul32 = True
-        if is_pkgconfig_file(pretty, mgs):
-            self.scan_pkgconfig(file)
+        if kind == FileKind.PKGCONFIG:
+            self.scan_pkgconfig(context, file)
 
         # Some things omit automatic dependencies
-        if share_ctx.spec.pkg_autodep:
-            if is_soname_link(file, mgs):
-                self.add_solink(file, pretty)
-            elif v_dyn.match(mgs):
-                self.scan_binary(file, True)
-            elif v_bin.match(mgs):
-                self.scan_binary(file, False)
-
-
-def strip_file(context, pretty, file, magic_string, mode=None):
-    """ Schedule a strip, basically. """
-    if not context.spec.pkg_strip:
-        return
-    exports = ["LC_ALL=C"]
-    if context.spec.pkg_optimize == "speed":
-        exports.extend([
-            "AR=\"gcc-ar\"",
-            "RANLIB=\"gcc-ranlib\"",
-            "NM=\"gcc-nm\""])
-
-    cmd = "{} strip {} \"{}\""
-    flags = ""
-    if mode == "shared":
-        flags = "--strip-unneeded"
-    elif mode == "ko":
-        flags = "-g --strip-unneeded"
-    elif mode == "ar":
-        flags = "--strip-debug"
+        if context.autodep:
+            if is_soname_link(file):
+                self.add_solink(context, file, pretty)
+            elif elf is not None and elf.is_shared():
+                self.scan_binary(file, elf, True)
+            elif elf is not None and elf.is_executable():
+                self.scan_binary(file, elf, False)
+
+
+# Flags passed to strip for each strip mode
+StripFlags = OrderedDict([
+    ("shared", ["--strip-unneeded"]),
+    ("executable", []),
+    ("ko", ["-g", "--strip-unneeded"]),
+    ("ar", ["--strip-debug"]),
+])
+
+# Upper bound of files passed to a single strip process
+STRIP_BATCH_SIZE = 256
+
+
+def get_strip_mode(context, elf, mode):
+    """ Return the strip mode to schedule for a file, or None if it
+        shouldn't be stripped at all """
+    if not context.strip:
+        return None
+    # Nothing left to strip, don't bother spawning strip
+    if elf is not None and not elf.has_symbols():
+        return None
+    return mode
+
+
+class StripJob:
+    """ A single file waiting to be stripped """
+
+    pretty = None
+    file = None
+    mode = None
+
+    def __init__(self, pretty, file, mode):
+        self.pretty = pretty
+        self.file = file
+        self.mode = mode
+
+
+def run_strip(env, flags, files):
+    """ Run a single strip process over many files, returning the error
+        output on failure, or None on success """
+    cmd = ["strip"] + flags + files
     try:
-        s = " ".join(exports)
-        subprocess.check_call(cmd.format(s, flags, file), shell=True)
-        console_ui.emit_info("Stripped", pretty)
+        p = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT)
+        out, err = p.communicate()
     except Exception as e:
-        console_ui.emit_warning("Strip", "Failed to strip '{}'".
-                                format(pretty))
-        print(e)
+        return str(e)
+    if p.returncode != 0:
+        return out.strip()
+    return None
+
+
+def timed_strip(env, flags, files, timings):
+    start = time.time()
+    err = run_strip(env, flags, files)
+    timings.add("strip", time.time() - start, 1)
+    return err
+
+
+def strip_batch(env, mode, jobs, timings):
+    """ Strip a batch of files of the same mode. When the batch fails, each
+        file is retried individually so that failures can be attributed to
+        the right file. Returns a list of (job, error) tuples. """
+    flags = StripFlags[mode]
+    err = timed_strip(env, flags, [x.file for x in jobs], timings)
+    if err is None:
+        return [(x, None) for x in jobs]
+    if len(jobs) == 1:
+        return [(jobs[0], err)]
+    return [(x, timed_strip(env, flags, [x.file], timings)) for x in jobs]
+
+
+class StripScheduler:
+    """ Groups files by their strip mode, and strips them with as few
+        strip processes as possible, spread over the available cores.
+        No shell is involved at any point. """
+
+    jobs = None
+    timings = None
+
+    def __init__(self, context, jobs):
+        self.jobs = max(jobs, 1)
+        self.timings = ToolTimings()
+        self.env = dict(os.environ)
+        self.env["LC_ALL"] = "C"
+        if context.optimize == "speed":
+            self.env["AR"] = "gcc-ar"
+            self.env["RANLIB"] = "gcc-ranlib"
+            self.env["NM"] = "gcc-nm"
+
+    def get_batches(self, strip_jobs):
+        """ Split the jobs into per-mode batches, sized so that each mode
+            is shared out between all of the workers """
+        batches = list()
+        for mode in StripFlags:
+            items = [x for x in strip_jobs if x.mode == mode]
+            if len(items) == 0:
+                continue
+            size = (len(items) + self.jobs - 1) // self.jobs
+            size = min(size, STRIP_BATCH_SIZE)
+            for i in range(0, len(items), size):
+                batches.append((mode, items[i:i + size]))
+        return batches
+
+    def run(self, strip_jobs):
+        """ Strip all of the given files, reporting each one """
+        batches = self.get_batches(strip_jobs)
+        if len(batches) == 0:
+            return
+
+        # Each batch records its own timings, merged once all are done
+        timings = [ToolTimings() for x in batches]
+        if self.jobs < 2 or len(batches) == 1:
+            results = [strip_batch(self.env, m, b, t)
+                       for (m, b), t in zip(batches, timings)]
+        else:
+            pool = multiprocessing.pool.ThreadPool(min(self.jobs,
+                                                       len(batches)))
+            try:
+                results = [pool.apply_async(strip_batch,
+                                            [self.env, m, b, t])
+                           for (m, b), t in zip(batches, timings)]
+                results = [x.get() for x in results]
+            finally:
+                pool.close()
+                pool.join()
+        for t in timings:
+            self.timings.merge(t)
+
+        for result in results:
+            for job, err in result:
+                if err is None:
+                    console_ui.emit_info("Stripped", job.pretty)
+                    continue
+                console_ui.emit_warning("Strip", "Failed to strip '{}'".
+                                        format(job.pretty))
+                print(err)
 
 
-def get_debug_path(context, file, magic_string):
+def get_debug_path(context, elf):
     """ Grab the NT_GNU_BUILD_ID """
-    cmd = "LC_ALL=C readelf -n \"{}\"".format(file)
-    try:
-        lines = subprocess.check_output(cmd, shell=True)
-    except Exception as e:
+    v = elf.get_build_id()
+    if v is None:
         return None
 
-    for line in lines.split("\n"):
-        if "Build ID:" not in line:
-            continue
-        v = line.split(":")[1].strip()
+    libdir = "/usr/lib"
+    if elf.is_32bit():
+        libdir = "/usr/lib32"
 
-        libdir = "/usr/lib"
-        if "ELF 32" in magic_string:
-            libdir = "/usr/lib32"
+    path = os.path.join(libdir, "debug", ".build-id", v[0:2], v[2:])
+    return path + ".debug"
 
-        path = os.path.join(libdir, "debug", ".build-id", v[0:2], v[2:])
-        return path + ".debug"
-    return None
 
+class Examination:
+    """ Outcome of examining a single file within a worker. Anything that
+        must happen afterwards in the main process (stripping, caching) is
+        recorded here alongside the FileReport. """
+
+    report = None
+
+    # Pending strip mode, if any
+    strip_mode = None
+
+    # Cache key, set when the result should be stored in the cache
+    cache_key = None
+    debug_path = None
+    debug_prefix = None
+
+    # Time spent examining the file, and within each tool
+    elapsed = 0.0
+    timings = None
 
-def examine_file(*args):
-    global share_ctx
-    package = args[0]
-    pretty = args[1]
-    file = args[2]
-    mgs = args[3]
-
-    context = share_ctx
-
-    if v_dyn.match(mgs):
-        # Get soname, direct deps and strip
-        store_debug(context, pretty, file, mgs)
-        strip_file(context, pretty, file, mgs, mode="shared")
-    elif v_bin.match(mgs):
-        # Get direct deps, and strip
-        store_debug(context, pretty, file, mgs)
-        strip_file(context, pretty, file, mgs, mode="executable")
-    elif v_rel.match(mgs):
-        # Kernel object in all probability
-        if file.endswith(".ko"):
-            store_debug(context, pretty, file, mgs)
-            strip_file(context, pretty, file, mgs, mode="ko")
-    elif mgs == "current ar archive":
+    def __init__(self, report):
+        self.report = report
+        self.timings = ToolTimings()
+
+    def alias(self, pretty, file):
+        """ Examination of a hard link to an already examined file, which
+            has nothing left to strip, cache or split """
+        return Examination(self.report.clone(pretty, file))
+
+
+def examine_file(context, pretty, file, kind):
+    """ Examine a single file, splitting debug information and working out
+        how it should be stripped. This runs within the worker pool, so it
+        must only rely on the picklable ExamineContext passed to it. """
+    start = time.time()
+    timings = ToolTimings()
+    exa = run_examination(context, pretty, file, kind, timings)
+    exa.timings = timings
+    exa.elapsed = time.time() - start
+    return exa
+
+
+def run_examination(context, pretty, file, kind, timings):
+    """ Examine a single file, recording the time spent in each tool """
+    elf = None
+    if kind == FileKind.ELF:
+        key = None
+        if context.cache_dir is not None:
+            cache = ExaminationCache(context.cache_dir)
+            start = time.time()
+            try:
+                key = cache.get_key(context, pretty, file)
+                entry = cache.lookup(key)
+                if entry is not None:
+                    freport = FileReport(context, pretty, file, kind)
+                    cache.restore(context, entry, freport, file)
+                    console_ui.emit_info("Cached", pretty)
+                    return Examination(freport)
+            except Exception as e:
+                console_ui.emit_warning("Cache", "Failed to restore '{}': {}".
+                                        format(pretty, e))
+                key = None
+            finally:
+                timings.add("cache", time.time() - start)
+
+        # Parse once, and share the result with every stage below
+        start = time.time()
+        try:
+            elf = ElfFile(file)
+        except Exception as e:
+            console_ui.emit_warning("ELF", "Failed to parse '{}': {}".
+                                    format(pretty, e))
+            return Examination(FileReport(context, pretty, file, kind))
+        finally:
+            timings.add("elf", time.time() - start)
+
+        mode = None
+        if elf.is_shared():
+            # Get soname, direct deps and strip
+            mode = "shared"
+        elif elf.is_executable():
+            # Get direct deps, and strip
+            mode = "executable"
+        elif elf.is_relocatable():
+            # Kernel object in all probability
+            if file.endswith(".ko"):
+                mode = "ko"
+
+        exa = Examination(FileReport(context, pretty, file, kind, elf))
+
+        # Prefer the fused backend, which leaves nothing left to strip
+        did = None
+        if mode is not None:
+            did = split_and_strip(context, pretty, file, elf, mode, timings)
+            if did is None:
+                did = store_debug(context, pretty, file, elf, timings)
+                exa.strip_mode = get_strip_mode(context, elf, mode)
+        exa.cache_key = key
+        exa.debug_path = did
+        if did is not None and elf.get_build_id() is None:
+            exa.debug_prefix = get_debug_prefix(elf)
+        return exa
+
+    start = time.time()
+    exa = Examination(FileReport(context, pretty, file, kind, elf))
+    if kind == FileKind.PKGCONFIG:
+        timings.add("pkgconfig", time.time() - start)
+    if kind == FileKind.AR:
         # Strip only.
-        strip_file(context, pretty, file, mgs, mode="ar")
+        exa.strip_mode = get_strip_mode(context, None, "ar")
+    return exa
+
+
+# Flags passed to eu-strip for each strip mode in the fused backend. A
+# plain eu-strip drops .symtab and the debug sections, leaving .dynsym, so
+# matches strip --strip-unneeded for shared objects. Kernel modules need
+# --strip-unneeded proper, which eu-strip lacks, so they are never fused.
+FusedStripFlags = {
+    "shared": [],
+    "executable": [],
+}
+
+
+def split_and_strip(context, pretty, file, elf, mode, timings):
+    """ Fused backend: produce the .debug file, add the debuglink and strip
+        the file with a single eu-strip invocation, rather than two objcopy
+        runs and a strip. Returns the debug path on success, or None if the
+        caller should fall back to store_debug and a scheduled strip. """
+    if context.eu_strip is None or mode not in FusedStripFlags:
+        return None
+    if not elf.has_symbols():
+        return None
+    # eu-strip may replace the file rather than rewrite it in place, which
+    # would leave the other hard links unstripped
+    if os.stat(file).st_nlink > 1:
+        return None
 
-    freport = FileReport(pretty, file, mgs)
-    return freport
+    did = get_debug_path(context, elf)
+    if did is None:
+        did = "{}/{}.debug".format(get_debug_prefix(elf), pretty)
+    did_full = os.path.join(context.get_install_dir(), did[1:])
+
+    dirs = os.path.dirname(did_full)
+    cmd = [context.eu_strip] + FusedStripFlags[mode] + ["-f", did_full, file]
+    start = time.time()
+    try:
+        if not os.path.exists(dirs):
+            os.makedirs(dirs, mode=00755)
+        p = subprocess.Popen(cmd, env={"LC_ALL": "C"},
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        out, err = p.communicate()
+    except Exception as e:
+        out = str(e)
+        p = None
+    timings.add("eu-strip", time.time() - start, 1)
+    if p is None or p.returncode != 0:
+        console_ui.emit_warning("eu-strip", "Failed to split '{}', falling "
+                                "back to objcopy".format(pretty))
+        print(out.strip())
+        return None
+    console_ui.emit_info("Stripped", pretty)
+    return did
+
+
+def get_debug_prefix(elf):
+    """ Debug directory used when there is no build-id """
+    if elf.is_32bit():
+        return "/usr/lib32/debug"
+    return "/usr/lib/debug"
 
 
-def store_debug(context, pretty, file, magic_string):
+def store_debug(context, pretty, file, elf, timings):
+    """ Split the debug information out of the file, returning the path of
+        the new debug file on success """
     if not context.can_dbginfo:
-        return
+        return None
 
-    did = get_debug_path(context, file, magic_string)
+    did = get_debug_path(context, elf)
 
     if did is None:
-        if "ELF 32" in magic_string:
-            did = "/usr/lib32/debug/{}.debug".format(pretty)
-        else:
-            did = "/usr/lib/debug/{}.debug".format(pretty)
+        did = "{}/{}.debug".format(get_debug_prefix(elf), pretty)
 
     did_full = os.path.join(context.get_install_dir(), did[1:])
 
@@ -294,21 +676,28 @@ def store_debug(context, pretty, file, magic_string):
         except Exception as e:
             console_ui.emit_error("Debug", "Failed to make directory")
             print e
-            return
+            return None
 
     cmd = "objcopy --only-keep-debug \"{}\" \"{}\"".format(file, did_full)
+    start = time.time()
     try:
         subprocess.check_call(cmd, shell=True)
     except Exception as e:
         console_ui.emit_warning("objcopy", "Failed --only-keep-debug")
-        return
+        return None
+    finally:
+        timings.add("objcopy", time.time() - start, 1)
     cmd = "objcopy --add-gnu-debuglink=\"{}\" \"{}\"".format(did_full,
                                                              file)
+    start = time.time()
     try:
         subprocess.check_call(cmd, shell=True)
     except Exception as e:
         console_ui.emit_warning("objcopy", "Failed --add-gnu-debuglink")
-        return
+        return None
+    finally:
+        timings.add("objcopy", time.time() - start, 1)
+    return did
 
 
 class PackageExaminer:
@@ -317,12 +706,38 @@ class PackageExaminer:
         providers, and even those that should be stripped
     """
 
-    def __init__(self):
-        self.libtool_file = re.compile("libtool library file, ASCII text.*")
+    # Number of workers to use, defaulting to the BuildConfig jobcount
+    jobs = None
+
+    # Use a thread pool instead of a process pool
+    use_threads = False
+
+    timings = None
 
-    def should_nuke_file(self, pretty, file, mgs):
+    # Write the timings out as JSON here, if set
+    timings_file = None
+
+    def __init__(self, jobs=None, use_threads=False):
+        self.classifier = FileClassifier()
+        self.jobs = jobs
+        self.use_threads = use_threads
+        self.timings = ExamineTimings()
+
+    def create_pool(self, context):
+        """ Create the worker pool used for examining files. A job count of
+            1 disables the pool entirely, examining files in process. """
+        jobs = self.jobs
+        if jobs is None:
+            jobs = context.build.jobcount
+        if jobs < 2:
+            return None
+        if self.use_threads:
+            return multiprocessing.pool.ThreadPool(jobs)
+        return multiprocessing.Pool(jobs)
+
+    def should_nuke_file(self, pretty, file, kind):
         # it's not that we hate.. Actually, no, we do. We hate you libtool.
-        if self.libtool_file.match(mgs):
+        if kind == FileKind.LIBTOOL:
             return True
         if pretty == "/usr/share/info/dir":
             return True
@@ -330,40 +745,33 @@ class PackageExaminer:
             return True
         return False
 
-    def file_is_of_interest(self, pretty, file, mgs):
+    def file_is_of_interest(self, pretty, file, kind):
         """ So we can keep our list of things to check low """
-        if v_dyn.match(mgs) or v_bin.match(mgs) or v_rel.match(mgs):
+        if kind == FileKind.ELF:
             return True
-        if is_pkgconfig_file(pretty, mgs):
+        if kind == FileKind.PKGCONFIG:
             return True
-        if is_soname_link(file, mgs):
+        if is_soname_link(file):
             return True
         return False
 
-    def examine_package(self, context, package):
-        """ Examine the given package and update symbols, etc. """
+    def collect_package(self, context, package):
+        """ Clean out unwanted files from the given package, returning the
+            files of interest as (pretty, file, kind, stat) tuples """
         install_dir = context.get_install_dir()
 
-        global share_ctx
-
-        share_ctx = context
-
-        # Right now we actually only care about magic matching
         removed = set()
 
-        # pool = multiprocessing.Pool()
         results = list()
 
         for file in package.emit_files():
             if file[0] == '/':
                 file = file[1:]
             fpath = os.path.join(install_dir, file)
-            try:
-                mgs = magic.from_file(fpath)
-            except Exception as e:
-                print(e)
+            kind = self.classifier.classify("/" + file, fpath)
+            if kind is None:
                 continue
-            if self.should_nuke_file("/" + file, fpath, mgs):
+            if self.should_nuke_file("/" + file, fpath, kind):
                 try:
                     if os.path.isfile(fpath):
                         os.unlink(fpath)
@@ -378,31 +786,142 @@ class PackageExaminer:
                 removed.add("/" + file)
                 continue
 
-            if not self.file_is_of_interest("/" + file, fpath, mgs):
+            if not self.file_is_of_interest("/" + file, fpath, kind):
                 continue
-            # Handle this asynchronously
-            results.append(examine_file(package, "/" + file, fpath, mgs))
-            # results.append(pool.apply_async(examine_file, [
-            #               package, "/" + file, fpath, mgs],
-            #               callback=None))
-
-        # pool.close()
-        # pool.join()
-
-        # infos = [x.get() for x in results]
+            results.append(("/" + file, fpath, kind, os.lstat(fpath)))
 
         for r in removed:
             package.remove_file(r)
         return results
 
+    def examine_files(self, context, work, pool=None):
+        """ Examine all files of interest from every package, returning the
+            results grouped by package name in the original order.
+
+            All files go into a single queue, largest first, so that one
+            huge library doesn't leave a long serial tail at the end of a
+            package while the other workers sit idle. """
+        ectx = ExamineContext(context)
+
+        # Hard linked ELF objects share a single examination of their inode,
+        # which is then attributed to every path. Only the first path is
+        # stripped. Anything else may depend on its path, i.e. .pc files.
+        queue = list()
+        inodes = dict()
+        aliases = list()
+        for name in work:
+            for i, item in enumerate(work[name]):
+                kind = item[2]
+                st = item[3]
+                if kind == FileKind.ELF and st.st_nlink > 1 and \
+                        stat.S_ISREG(st.st_mode):
+                    inode = (st.st_dev, st.st_ino)
+                    if inode in inodes:
+                        aliases.append((name, i, inodes[inode]))
+                        continue
+                    inodes[inode] = (name, i)
+                queue.append((st.st_size, name, i))
+        # Stable, so equally sized files keep their package order
+        queue.sort(key=lambda x: x[0], reverse=True)
+
+        results = dict()
+        for name in work:
+            results[name] = [None] * len(work[name])
+        for size, name, i in queue:
+            pretty, fpath, kind, st = work[name][i]
+            args = [ectx, pretty, fpath, kind]
+            if pool is None:
+                results[name][i] = examine_file(*args)
+            else:
+                results[name][i] = pool.apply_async(examine_file, args)
+
+        if pool is not None:
+            for name in results:
+                results[name] = [x.get() if x is not None else None
+                                 for x in results[name]]
+
+        for name, i, (owner, owner_i) in aliases:
+            pretty, fpath, kind, st = work[name][i]
+            results[name][i] = results[owner][owner_i].alias(pretty, fpath)
+        if len(aliases) > 0:
+            console_ui.emit_info("Examine", "Reused examinations for {} "
+                                 "hard links".format(len(aliases)))
+        return results
+
+    def finish_examinations(self, context, exas):
+        """ Strip everything the workers scheduled for stripping in as few
+            batches as possible, and then populate the cache with the final
+            results """
+        ectx = ExamineContext(context)
+        jobs = self.jobs
+        if jobs is None:
+            jobs = context.build.jobcount
+
+        strips = [StripJob(x.report.pretty, x.report.file, x.strip_mode)
+                  for x in exas if x.strip_mode is not None]
+        scheduler = StripScheduler(ectx, jobs)
+        scheduler.run(strips)
+        self.timings.tools.merge(scheduler.timings)
+
+        if ectx.cache_dir is None:
+            return
+        cache = ExaminationCache(ectx.cache_dir)
+        for exa in exas:
+            if exa.cache_key is None:
+                continue
+            start = time.time()
+            cache.store(ectx, exa.cache_key, exa.report, exa.report.file,
+                        exa.debug_path, exa.debug_prefix)
+            self.timings.tools.add("cache", time.time() - start)
+
     def examine_packages(self, context, packages):
         """ Examine all packages, in order to update dependencies, etc """
         console_ui.emit_info("Examine", "Examining packages")
+        start = time.time()
 
-        examinations = dict()
+        pool = self.create_pool(context)
+
+        work = OrderedDict()
         for package in packages:
-            ir = self.examine_package(context, package)
-            if not ir:
+            items = self.collect_package(context, package)
+            if not items:
                 continue
-            examinations[package.name] = ir
+            work[package.name] = items
+
+        examinations = dict()
+        exas = list()
+        try:
+            results = self.examine_files(context, work, pool)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        for name in work:
+            exas.extend(results[name])
+            examinations[name] = [x.report for x in results[name]]
+            for exa in results[name]:
+                self.timings.add_file(name, exa.report.pretty, exa.elapsed)
+                self.timings.tools.merge(exa.timings)
+
+        self.finish_examinations(context, exas)
+
+        if context.build.examine_cache_size > 0:
+            cache = ExaminationCache(context.get_examine_cache_dir())
+            cache.prune(context.build.examine_cache_size)
+
+        console_ui.emit_info("Examine", "Classified {} files, avoided {} "
+                             "libmagic calls".format(
+                                self.classifier.classified,
+                                self.classifier.get_avoided()))
+
+        self.timings.tools.merge(self.classifier.timings)
+        self.timings.elapsed = time.time() - start
+        self.timings.print_summary()
+        if self.timings_file is not None:
+            try:
+                self.timings.write(self.timings_file)
+            except Exception as e:
+                console_ui.emit_warning("Examine", "Failed to write timings:"
+                                        " {}".format(e))
         return examinations
@@ -0,0 +1,173 @@
+#!/bin/true
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+
+from . import console_ui
+
+import os
+import hashlib
+import pickle
+import shutil
+import tempfile
+
+# Bump this whenever the entry layout or examination semantics change
+CACHE_VERSION = 3
+
+# FileReport fields restored from the cache
+CachedFields = ["soname", "symbol_deps", "rpaths"]
+
+
+class ExaminationCache:
+    """ Persistent, content addressed cache of examination results.
+
+        Entries are keyed by the hash of the unstripped file along with the
+        context affecting the examination, and hold the FileReport fields,
+        the final (stripped) file and the split debug file. A hit restores
+        all of these without spawning a single tool.
+
+        Each entry is a directory, written atomically, whose mtime is bumped
+        on every hit so that prune() can evict the least recently used. """
+
+    root = None
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_key(self, context, pretty, file):
+        """ Compute the key for a given file within the given context. The
+            basename is included as the .gnu_debuglink of objects without a
+            build-id names it, and the tool versions as a binutils update
+            may well change the stripped output """
+        h = hashlib.sha256()
+        emul32 = pretty.startswith(("/usr/lib32/", "/lib32"))
+        h.update("{}:{}:{}:{}:{}:{}:{}:{}:{}\n".format(
+                 CACHE_VERSION, emul32, context.autodep, context.strip,
+                 context.can_dbginfo, context.eu_strip is not None,
+                 file.endswith(".ko"), os.path.basename(pretty),
+                 context.tool_versions))
+        with open(file, "rb") as inp:
+            while True:
+                chunk = inp.read(1024 * 1024)
+                if not chunk:
+                    break
+                h.update(chunk)
+        return h.hexdigest()
+
+    def get_entry_dir(self, key):
+        return os.path.join(self.root, key[0:2], key)
+
+    def lookup(self, key):
+        """ Return the cached entry for the key, or None on a miss """
+        entry_dir = self.get_entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, "report"), "rb") as inp:
+                entry = pickle.load(inp)
+            os.utime(entry_dir, None)
+        except Exception as e:
+            return None
+        entry["dir"] = entry_dir
+        return entry
+
+    def restore(self, context, entry, report, file):
+        """ Restore a cached entry over the given file, populating the
+            report and emitting the cached debug file """
+        entry_dir = entry["dir"]
+        shutil.copyfile(os.path.join(entry_dir, "file"), file)
+
+        for field in CachedFields:
+            setattr(report, field, entry[field])
+
+        did = entry["debug"]
+        if did is None:
+            return
+        if entry["debug_prefix"] is not None:
+            did = "{}/{}.debug".format(entry["debug_prefix"], report.pretty)
+        did_full = os.path.join(context.get_install_dir(), did[1:])
+        dirs = os.path.dirname(did_full)
+        if not os.path.exists(dirs):
+            os.makedirs(dirs, mode=00755)
+        # The mode ends up in the files.xml, so must match a fresh build
+        shutil.copyfile(os.path.join(entry_dir, "debug"), did_full)
+        shutil.copymode(os.path.join(entry_dir, "debug"), did_full)
+
+    def store(self, context, key, report, file, did=None, prefix=None):
+        """ Store the examination of a file. did is the debug file path, and
+            prefix is set if that path was derived from the file path rather
+            than the build-id """
+        entry_dir = self.get_entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        entry = dict()
+        for field in CachedFields:
+            entry[field] = getattr(report, field)
+        entry["debug"] = did
+        entry["debug_prefix"] = prefix
+
+        parent = os.path.dirname(entry_dir)
+        tmp = None
+        try:
+            if not os.path.exists(parent):
+                os.makedirs(parent, mode=00755)
+            tmp = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+            shutil.copyfile(file, os.path.join(tmp, "file"))
+            if did is not None:
+                did_full = os.path.join(context.get_install_dir(), did[1:])
+                shutil.copyfile(did_full, os.path.join(tmp, "debug"))
+                shutil.copymode(did_full, os.path.join(tmp, "debug"))
+            with open(os.path.join(tmp, "report"), "wb") as out:
+                pickle.dump(entry, out, 2)
+            os.rename(tmp, entry_dir)
+            tmp = None
+        except Exception as e:
+            # Losing a race to another worker is perfectly fine
+            if not os.path.exists(entry_dir):
+                console_ui.emit_warning("Cache", "Failed to store examination"
+                                        " of {}: {}".format(report.pretty, e))
+        finally:
+            if tmp is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+    def prune(self, max_size):
+        """ Evict the least recently used entries until the cache fits
+            within max_size bytes """
+        if not os.path.exists(self.root):
+            return
+        entries = list()
+        total = 0
+        for bucket in os.listdir(self.root):
+            bdir = os.path.join(self.root, bucket)
+            if not os.path.isdir(bdir):
+                continue
+            for key in os.listdir(bdir):
+                edir = os.path.join(bdir, key)
+                try:
+                    size = sum([os.path.getsize(os.path.join(edir, x))
+                                for x in os.listdir(edir)])
+                    mtime = os.stat(edir).st_mtime
+                except Exception as e:
+                    continue
+                entries.append((mtime, size, edir))
+                total += size
+
+        if total <= max_size:
+            return
+
+        evicted = 0
+        for mtime, size, edir in sorted(entries):
+            if total <= max_size:
+                break
+            shutil.rmtree(edir, ignore_errors=True)
+            total -= size
+            evicted += 1
+        console_ui.emit_info("Cache", "Evicted {} examination cache entries".
+                             format(evicted))
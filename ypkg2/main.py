@@ -19,6 +19,7 @@ from .ypkgcontext import YpkgContext
 from .scripts import ScriptGenerator
 from .packages import PackageGenerator, PRIORITY_USER
 from .examine import PackageExaminer
+from .debuginfo import DebugOptimizer
 from . import metadata
 from .dependencies import DependencyResolver
 from . import packager_name, packager_email
@@ -53,6 +54,12 @@ def main():
                         help="Show version information and exit")
     parser.add_argument("-D", "--output-dir", type=str,
                         help="Set the output directory for resulting files")
+    parser.add_argument("-t", "--timings", action="store_true",
+                        help="Write examine phase timings to the output "
+                        "directory")
+    parser.add_argument("-p", "--profile-patterns", action="store_true",
+                        help="Report per pattern statistics for package "
+                        "splitting")
     # Main file
     parser.add_argument("filename", help="Path to the ypkg YAML file to build",
                         nargs='?')
@@ -93,7 +100,8 @@ def main():
                               "or as the root user (not recommended)")
         sys.exit(1)
 
-    build_package(args.filename, outputDir)
+    build_package(args.filename, outputDir, args.timings,
+                  args.profile_patterns)
 
 
 def clean_build_dirs(context):
@@ -141,7 +149,7 @@ def execute_step(context, step, step_n, work_dir):
     return True
 
 
-def build_package(filename, outputDir):
+def build_package(filename, outputDir, timings=False, profile=False):
     """ Will in future be moved to a separate part of the module """
     spec = YpkgSpec()
     if not spec.load_from_path(filename):
@@ -314,6 +322,8 @@ def build_package(filename, outputDir):
     # Add user patterns - each consecutive package has higher priority than the
     # package before it, ensuring correct levels of control
     gene = PackageGenerator(spec)
+    if profile:
+        gene.enable_profiling()
     count = 0
     for pkg in spec.patterns:
         for pt in spec.patterns[pkg]:
@@ -351,12 +361,18 @@ def build_package(filename, outputDir):
             sys.exit(1)
 
     exa = PackageExaminer()
+    if timings:
+        exa.timings_file = os.path.join(outputDir, "examine-timings_{}.json".
+                                        format(ctx.build.arch))
     exaResults = exa.examine_packages(ctx, gene.packages.values())
     if exaResults is None:
         console_ui.emit_error("Package", "Failed to correctly examine all "
                               "packages.")
         sys.exit(1)
 
+    if ctx.can_dbginfo:
+        DebugOptimizer(ctx).optimize()
+
     deps = DependencyResolver()
     if not deps.compute_for_packages(ctx, gene, exaResults):
         console_ui.emit_error("Dependencies", "Failed to compute all"
@@ -407,6 +423,9 @@ def build_package(filename, outputDir):
                                 "Did not produce {} by any pattern".format(nm))
 
     # TODO: Consider warning about unused patterns
+    if profile:
+        gene.profiler.print_report(gene.patterns)
+
     ctx.clean_pkg()
     console_ui.emit_success("Package", "Building complete")
     sys.exit(0)
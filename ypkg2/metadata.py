@@ -470,6 +470,11 @@ def write_spec(context, gene, outputDir):
     for i in gene.packages:
         all_names.add(context.spec.get_package_name(i))
 
+    # Collapse the loose files into directories where possible
+    users = None
+    if context.spec.pkg_compactpspec:
+        users = gene.get_path_users()
+
     for pkg in packages:
         package = accum_packages[pkg]
 
@@ -485,7 +490,9 @@ def write_spec(context, gene, outputDir):
             setattr(specPkg, item, getattr(package.package, item))
 
         # Now the fun bit.
-        for f in sorted(gene.packages[pkg].emit_files_by_pattern()):
+        pkgFiles = gene.packages[pkg].emit_files_by_pattern(users,
+                                                            FileTypes.keys())
+        for f in sorted(pkgFiles):
             fc = pisi.specfile.Path()
             fc.path = f
             fc.fileType = get_file_type(f)
@@ -15,9 +15,12 @@
 #  (at your option) any later version.
 
 from . import console_ui
-from .stringglob import StringPathGlob
+from .stringglob import StringPathGlob, PathGlobIndex
+from .pathtable import PathTable, PathSet
 
+import array
 import os
+import time
 
 PRIORITY_DEFAULT = 0    # Standard internal priority for a pattern
 PRIORITY_USER = 100     # Priority for a user pattern, do what they say.
@@ -26,6 +29,8 @@ DBG = 1000              # Never allow the user to override these guys.
 
 class DefaultPolicy(StringPathGlob):
 
+    __slots__ = []
+
     def __init__(self):
         StringPathGlob.__init__(self, "a")
         pass
@@ -44,11 +49,20 @@ class Package:
     # Symbols depended upon by this package
     depend_packages = None
 
-    def __init__(self, name):
+    # Cached emit_files result, reset whenever the files change
+    emitted = None
+
+    # Path storage shared with the other packages of the build
+    table = None
+
+    def __init__(self, name, table=None):
         self.name = name
+        if table is None:
+            table = PathTable()
+        self.table = table
         self.patterns = dict()
-        self.files = set()
-        self.excludes = set()
+        self.files = PathSet(table)
+        self.excludes = PathSet(table)
 
         self.provided_symbols = set()
         self.depend_packages = set()
@@ -59,7 +73,8 @@ class Package:
         """ Return a matching pattern for the given path.
             This is ordered according to priority to enable
             multiple layers of priorities """
-        matches = [p for p in self.patterns if p.match(path)]
+        splits = path.split(os.sep)
+        matches = [p for p in self.patterns if p.match(path, splits)]
         if len(matches) == 0:
             return self.default_policy
 
@@ -69,12 +84,17 @@ class Package:
 
     def add_file(self, pattern, path):
         """ Add a file by a given pattern to this package """
+        self.add_id(pattern, self.table.intern(path))
+
+    def add_id(self, pattern, pid):
+        """ Add a file by its id in the path table """
         if pattern is None:
             pattern = self.default_policy
         if pattern not in self.patterns:
-            self.patterns[pattern] = set()
-        self.patterns[pattern].add(path)
-        self.files.add(path)
+            self.patterns[pattern] = PathSet(self.table)
+        self.patterns[pattern].add_id(pid)
+        self.files.add_id(pid)
+        self.emitted = None
 
     def remove_file(self, path):
         """ Remove a file from this package if it owns it """
@@ -83,53 +103,180 @@ class Package:
             return
         if path in self.patterns[pat]:
             self.patterns[pat].remove(path)
+            self.emitted = None
         if path in self.files:
             self.files.remove(path)
 
     def exclude_file(self, path):
         """ Exclude a file from this package if it captures it """
-        pat = self.get_pattern(path)
-        if not pat:
-            return
-        if path in self.files:
-            self.files.remove(path)
-        self.excludes.add(path)
+        self.exclude_id(self.table.intern(path))
+
+    def exclude_id(self, pid):
+        """ Exclude a file by its id in the path table """
+        if self.files.has_id(pid):
+            self.files.discard_id(pid)
+            self.emitted = None
+        self.excludes.add_id(pid)
 
     def emit_files(self):
         """ Emit actual file lists, vs the globs we have """
-        ret = set()
-        for pt in self.patterns:
-            adds = [x for x in self.patterns[pt] if x not in self.excludes]
-            ret.update(adds)
-        return sorted(ret)
+        if self.emitted is None:
+            ret = set()
+            for pt in self.patterns:
+                ret.update(self.patterns[pt].iter_ids(self.excludes))
+            self.emitted = sorted(self.table.get_paths(ret))
+        # Callers are free to modify their copy
+        return list(self.emitted)
+
+    def get_collapsed_path(self, path, users, stops):
+        """ Return the shallowest directory of the path used by no other
+            package and containing none of the stops, or the path itself.
+            Never returns "/" """
+        prefix = ""
+        for elem in path.split(os.sep)[1:]:
+            prefix += os.sep + elem
+            if users.get(prefix) != self.name:
+                continue
+            below = prefix + os.sep
+            if any(x.startswith(below) for x in stops):
+                continue
+            return prefix
+        return path
 
-    def emit_files_by_pattern(self):
+    def emit_files_by_pattern(self, users=None, stops=None):
         """ Emit file lists, using the globs though. Note that eopkg has no
             exclude concept, this is left for us to handle as we build the
-            resulting eopkg ourselves """
+            resulting eopkg ourselves
+
+            When users (from PackageGenerator.get_path_users) is given, the
+            files under the default policy are collapsed into the fewest
+            directories that capture nothing from any other package. These
+            never contain any of the stops (i.e. the prefixes deciding the
+            file type) nor our own pattern entries, and entries covered by
+            our patterns are dropped """
         ret = set()
+        defaults = list()
+        globs = list()
         for pt in self.patterns:
-            pat = self.patterns[pt]
-
-            tmp = set([x for x in pat if x not in self.excludes])
-            if len(tmp) == 0:
-                continue
+            ids = self.patterns[pt].iter_ids(self.excludes)
             # Default policy, just list all the files
             if isinstance(pt, DefaultPolicy):
-                ret.update(tmp)
-            else:
+                defaults.extend(self.table.get_paths(ids))
+            elif next(ids, None) is not None:
+                globs.append(pt)
                 ret.add(str(pt))
+
+        if users is not None:
+            stops = list(stops or []) + [str(x) for x in globs]
+            paths = set(self.get_collapsed_path(x, users, stops)
+                        for x in defaults)
+            defaults = [x for x in paths
+                        if not any(g.match(x) for g in globs)]
+        ret.update(defaults)
         return sorted(ret)
 
 
+class PatternStats:
+    """ Statistics for a single pattern """
+
+    tested = 0
+    matched = 0
+    won = 0
+    elapsed = 0.0
+
+
+class PatternProfiler:
+    """ Opt-in profiler for package splitting. Rather than using the pattern
+        index, every pattern is matched against every path individually so
+        that the cost and usefulness of each one can be measured, giving
+        exactly the same result as the index. """
+
+    stats = None
+
+    def __init__(self):
+        self.stats = dict()
+
+    def get_stats(self, pattern):
+        stats = self.stats.get(pattern)
+        if stats is None:
+            stats = PatternStats()
+            self.stats[pattern] = stats
+        return stats
+
+    def get_pattern(self, patterns, path):
+        """ Find the best pattern for the path, recording statistics """
+        splits = path.split(os.sep)
+        best = None
+        best_key = None
+        for rank, pattern in enumerate(patterns):
+            stats = self.get_stats(pattern)
+            start = time.time()
+            matched = pattern.match(path, splits)
+            stats.elapsed += time.time() - start
+            stats.tested += 1
+            if not matched:
+                continue
+            stats.matched += 1
+            # Equal priorities are ranked by order, as with the index
+            key = (pattern.priority, -rank)
+            if best is None or key > best_key:
+                best = pattern
+                best_key = key
+        if best is not None:
+            self.get_stats(best).won += 1
+        return best
+
+    def print_report(self, patterns):
+        """ Print the statistics for every pattern, slowest first """
+        console_ui.emit_info("Patterns", "Pattern statistics:")
+        print("{:<40} {:<16} {:>8} {:>8} {:>8} {:>8} {:>9}".format(
+              "Pattern", "Package", "Priority", "Tested", "Matched", "Won",
+              "Time (ms)"))
+        items = sorted(self.stats.items(), key=lambda x: (-x[1].elapsed,
+                                                          str(x[0])))
+        for pattern, stats in items:
+            print("{:<40} {:<16} {:>8} {:>8} {:>8} {:>8} {:>9.2f}".format(
+                  str(pattern), patterns.get(pattern, ""), pattern.priority,
+                  stats.tested, stats.matched, stats.won,
+                  stats.elapsed * 1000.0))
+
+
 class PackageGenerator:
 
     patterns = None
     packages = None
 
+    # Built on demand from patterns, and reset when a pattern is added
+    pattern_index = None
+
+    # Every path of the build, shared by all packages
+    paths = None
+
+    # Owning package of every added path by id, as an index into
+    # package_names, or -1
+    owners = None
+    package_names = None
+    package_ids = None
+
+    # Paths added to more than one package. Files only reach a package
+    # through add_file, so the packages still holding one are its holders
+    contested = None
+
+    # Cached os.path.realpath results, for get_file_owner
+    realpaths = None
+
+    # Set when pattern profiling is enabled
+    profiler = None
+
     def __init__(self, spec):
         self.patterns = dict()
         self.packages = dict()
+        self.paths = PathTable()
+        self.owners = array.array("i")
+        self.package_names = list()
+        self.package_ids = dict()
+        self.contested = PathSet(self.paths)
+        self.realpaths = dict()
 
         self.add_pattern("/usr/bin", "main")
         self.add_pattern("/usr/sbin", "main")
@@ -207,8 +354,19 @@ class PackageGenerator:
             target = self.patterns[pattern]
 
         if target not in self.packages:
-            self.packages[target] = Package(target)
-        self.packages[target].add_file(pattern, path)
+            self.packages[target] = Package(target, self.paths)
+        pid = self.paths.intern(path)
+        self.packages[target].add_id(pattern, pid)
+
+        idx = self.get_package_index(target)
+        owners = self.owners
+        if pid < len(owners):
+            owner = owners[pid]
+            if owner >= 0 and owner != idx:
+                self.contested.add_id(pid)
+            owners[pid] = idx
+        else:
+            self.set_owner_name(pid, target)
 
     def remove_file(self, path):
         """ Remove a file from our set, in any of our main or sub packages
@@ -216,18 +374,24 @@ class PackageGenerator:
 
         for pkg in self.packages:
             self.packages[pkg].remove_file(path)
+        pid = self.paths.lookup(path)
+        if pid is not None:
+            self.set_owner_name(pid, None)
+            self.contested.discard_id(pid)
 
     def get_pattern(self, path):
         """ Return a matching pattern for the given path.
             This is ordered according to priority to enable
             multiple layers of priorities """
-        matches = [p for p in self.patterns if p.match(path)]
-        if len(matches) == 0:
-            return None
+        if self.profiler is not None:
+            return self.profiler.get_pattern(self.patterns, path)
+        if self.pattern_index is None:
+            self.pattern_index = PathGlobIndex(self.patterns)
+        return self.pattern_index.match(path)
 
-        matches = sorted(matches, key=StringPathGlob.get_priority,
-                         reverse=True)
-        return matches[0]
+    def enable_profiling(self):
+        """ Collect per pattern statistics, at the cost of speed """
+        self.profiler = PatternProfiler()
 
     def add_pattern(self, pattern, pkgName, priority=PRIORITY_DEFAULT):
         """ Add a pattern to the internal map according to the
@@ -241,28 +405,110 @@ class PackageGenerator:
 
         obj = StringPathGlob(pattern, prefixMatch=is_prefix, priority=priority)
         self.patterns[obj] = pkgName
+        self.pattern_index = None
 
     def emit_packages(self):
         """ Ensure we've finalized our state, allowing proper theft and
             exclusion to take place, and then return all package objects
             that we've managed to generate. There is no gaurantee that
             a "main" package will be generated, as patterns may omit
-            the production of one. """
-
-        for package in self.packages:
-            for comparison in self.packages:
-                if comparison == package:
+            the production of one.
+
+            Only paths held by more than one package need any exclusion,
+            and these are known up front from the ownership map. The last
+            holder in package order keeps the path, as it always has. """
+
+        # Walk backwards, so the first holder seen of a path keeps it
+        kept = PathSet(self.paths)
+        for name in reversed(list(self.packages)):
+            pkg = self.packages[name]
+            idx = self.get_package_index(name)
+            for pid in list(self.contested.iter_ids(within=pkg.files)):
+                if kept.has_id(pid):
+                    pkg.exclude_id(pid)
                     continue
-                for file in self.packages[comparison].emit_files():
-                    self.packages[package].exclude_file(file)
+                kept.add_id(pid)
+                # Contested paths were all added, so they're in the map
+                self.owners[pid] = idx
+
+    def get_path_users(self):
+        """ Map every emitted path, and each of its parent directories, to
+            the package using it, or None when used by several packages """
+        ret = dict()
+        for name in self.packages:
+            for path in self.packages[name].emit_files():
+                while path != os.sep and path != "":
+                    cur = ret.get(path, False)
+                    # Parents are already marked from here on
+                    if cur is None or cur == name:
+                        break
+                    ret[path] = name if cur is False else None
+                    path = os.path.dirname(path)
+        return ret
+
+    def get_owner_name(self, pid):
+        """ Name of the package owning the path id in the ownership map """
+        if pid is None or pid >= len(self.owners):
+            return None
+        idx = self.owners[pid]
+        if idx < 0:
+            return None
+        return self.package_names[idx]
+
+    def set_owner_name(self, pid, name):
+        """ Record the owning package of the path id, or None to clear it """
+        if pid >= len(self.owners):
+            self.owners.extend([-1] * (pid + 1 - len(self.owners)))
+        if name is None:
+            self.owners[pid] = -1
+            return
+        self.owners[pid] = self.get_package_index(name)
+
+    def get_package_index(self, name):
+        """ Index of the package name in package_names, adding it if new """
+        idx = self.package_ids.get(name)
+        if idx is None:
+            idx = len(self.package_names)
+            self.package_names.append(name)
+            self.package_ids[name] = idx
+        return idx
+
+    def get_path_owner(self, path):
+        """ Return the package currently holding the exact path, if any """
+        pid = self.paths.lookup(path)
+        name = self.get_owner_name(pid)
+        if name is None:
+            return None
+        if self.contested.has_id(pid):
+            for pkg in self.packages:
+                if self.packages[pkg].files.has_id(pid):
+                    return self.packages[pkg]
+            return None
+        # Files may be removed from the package directly after examination
+        package = self.packages[name]
+        if package.files.has_id(pid):
+            return package
+        return None
 
     def get_file_owner(self, file):
         """ Return the owning package for the specified file """
-        rname = os.path.realpath(file)
+        owner = self.get_path_owner(file)
+
+        rname = self.realpaths.get(file)
+        if rname is None:
+            rname = os.path.realpath(file)
+            self.realpaths[file] = rname
+        if rname == file:
+            return owner
+
+        rowner = self.get_path_owner(rname)
+        if owner is None:
+            return rowner
+        if rowner is None or rowner is owner:
+            return owner
+        # Both are owned, the first package in order wins
         for pkg in self.packages:
             package = self.packages[pkg]
-            if file in package.files:
-                return package
-            elif rname in package.files:
+            if package is owner or package is rowner:
                 return package
         return None
@@ -0,0 +1,176 @@
+#!/bin/true
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+
+import array
+import re
+
+# Finds the non empty bytes of a PathSet bitmap
+nonzero_byte = re.compile(b"[^\x00]")
+
+# Offsets of the set bits within every possible byte value
+byte_bits = [tuple(i for i in range(0, 8) if value & (1 << i))
+             for value in range(0, 256)]
+
+
+class PathTable(object):
+    """ Append-only table of every path seen during a build, shared by all
+        packages. Each directory is stored once, with a dict mapping the
+        basenames within it to their ids, so that a path costs its basename
+        and a hash table entry rather than the full path string. Paths are
+        referred to by integer id. """
+
+    __slots__ = ["dirs", "dir_ids", "dir_names", "path_dirs", "path_names"]
+
+    def __init__(self):
+        self.dirs = list()
+        self.dir_ids = dict()
+        # Per directory, the path id of each basename
+        self.dir_names = list()
+        self.path_dirs = array.array("i")
+        self.path_names = list()
+
+    def __len__(self):
+        return len(self.path_dirs)
+
+    def lookup(self, path):
+        """ Return the id of a path, or None if it was never interned. The
+            directory keeps its trailing separator, so that it and the
+            basename concatenate back to the exact path """
+        idx = path.rfind("/") + 1
+        did = self.dir_ids.get(path[:idx])
+        if did is None:
+            return None
+        return self.dir_names[did].get(path[idx:])
+
+    def intern(self, path):
+        """ Return the id of a path, adding it if needed """
+        idx = path.rfind("/") + 1
+        dirname = path[:idx]
+        did = self.dir_ids.get(dirname)
+        if did is None:
+            did = len(self.dirs)
+            self.dirs.append(dirname)
+            self.dir_ids[dirname] = did
+            self.dir_names.append(dict())
+
+        names = self.dir_names[did]
+        name = path[idx:]
+        pid = names.get(name)
+        if pid is not None:
+            return pid
+
+        pid = len(self.path_dirs)
+        self.path_dirs.append(did)
+        self.path_names.append(name)
+        names[name] = pid
+        return pid
+
+    def get_path(self, pid):
+        """ Rebuild the path string for the given id """
+        return self.dirs[self.path_dirs[pid]] + self.path_names[pid]
+
+    def get_paths(self, pids):
+        """ Rebuild the path strings for many ids at once """
+        dirs = self.dirs
+        path_dirs = self.path_dirs
+        path_names = self.path_names
+        return [dirs[path_dirs[x]] + path_names[x] for x in pids]
+
+
+class PathSet(object):
+    """ Set of paths backed by a bitmap over the ids of a PathTable, giving
+        one bit per path rather than a hash table entry and a string. This
+        supports the subset of the set API used for package file lists. """
+
+    __slots__ = ["table", "bits", "count"]
+
+    def __init__(self, table, paths=None):
+        self.table = table
+        self.bits = bytearray()
+        self.count = 0
+        if paths is not None:
+            for path in paths:
+                self.add(path)
+
+    def __len__(self):
+        return self.count
+
+    def has_id(self, pid):
+        try:
+            return (self.bits[pid >> 3] >> (pid & 7)) & 1 == 1
+        except IndexError:
+            return False
+
+    def __contains__(self, path):
+        pid = self.table.lookup(path)
+        if pid is None:
+            return False
+        # has_id, inlined as this is the hottest path
+        try:
+            return (self.bits[pid >> 3] >> (pid & 7)) & 1 == 1
+        except IndexError:
+            return False
+
+    def add(self, path):
+        self.add_id(self.table.intern(path))
+
+    def add_id(self, pid):
+        byte = pid >> 3
+        bits = self.bits
+        if byte >= len(bits):
+            # Grow geometrically, as ids mostly arrive in ascending order
+            bits.extend(bytearray(max(byte + 1, len(bits) * 2) - len(bits)))
+        bit = 1 << (pid & 7)
+        value = bits[byte]
+        if not value & bit:
+            bits[byte] = value | bit
+            self.count += 1
+
+    def discard(self, path):
+        pid = self.table.lookup(path)
+        if pid is not None:
+            self.discard_id(pid)
+
+    def discard_id(self, pid):
+        if not self.has_id(pid):
+            return
+        self.bits[pid >> 3] &= ~(1 << (pid & 7)) & 0xff
+        self.count -= 1
+
+    def remove(self, path):
+        if path not in self:
+            raise KeyError(path)
+        self.discard(path)
+
+    def iter_ids(self, excludes=None, within=None):
+        """ Iterate the ids within this set, skipping empty bytes in C.
+            Ids within excludes are skipped, as are those not within within
+            when given. The set must not change during iteration """
+        bits = self.bits
+        masks = excludes.bits if excludes is not None else bytearray()
+        nmasks = len(masks)
+        for m in nonzero_byte.finditer(bits):
+            byte = m.start()
+            value = bits[byte]
+            if byte < nmasks:
+                value &= ~masks[byte]
+            if within is not None:
+                value &= within.bits[byte] if byte < len(within.bits) else 0
+            base = byte << 3
+            for i in byte_bits[value]:
+                yield base | i
+
+    def __iter__(self):
+        get_path = self.table.get_path
+        for pid in self.iter_ids():
+            yield get_path(pid)
@@ -0,0 +1,165 @@
+#!/bin/true
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+
+import os
+import re
+
+# Either a variable definition (name=value) or a keyword (Name: value)
+pc_line = re.compile(r"^([A-Za-z0-9_.]+)\s*([:=])\s*(.*)$")
+pc_var = re.compile(r"\$\$|\$\{([^}]*)\}")
+
+# Module lists are split on commas and whitespace, operators may be attached
+pc_module_token = re.compile(r"[<>=!]+|,|[^\s,<>=!]+")
+pc_operators = ["<", "<=", "=", "!=", ">=", ">"]
+
+
+class PkgConfigError(Exception):
+    """ Raised when a .pc file cannot be read """
+    pass
+
+
+class PkgConfigFile:
+    """ In-process reader for pkg-config .pc files, following the same
+        rules as pkg-config itself for comments, line continuations and
+        ${variable} expansion, so that Requires and Requires.private can be
+        read without spawning pkg-config twice for every file.
+
+        The file is parsed once up front. """
+
+    path = None
+    variables = None
+    fields = None
+
+    requires = None
+    requires_private = None
+
+    def __init__(self, path, search_path):
+        self.path = path
+        self.fields = dict()
+
+        # Builtins, as defined by pkg-config before parsing a file
+        self.variables = {
+            "pc_path": search_path,
+            "pcfiledir": os.path.dirname(os.path.abspath(path)),
+            "pc_sysrootdir": "/",
+            "pc_top_builddir": "$(top_builddir)",
+        }
+
+        try:
+            with open(path, "r") as infile:
+                data = infile.read()
+        except Exception as e:
+            raise PkgConfigError("Cannot read {}: {}".format(path, e))
+
+        for line in self.get_lines(data):
+            self.parse_line(line)
+
+        self.requires = self.parse_modules(self.fields.get("Requires", ""))
+        self.requires_private = self.parse_modules(
+            self.fields.get("Requires.private", ""))
+
+    def get_lines(self, data):
+        """ Split into logical lines, handling escapes and comments """
+        lines = list()
+        cur = list()
+        i = 0
+        length = len(data)
+        while i < length:
+            c = data[i]
+            if c == "\\" and i + 1 < length:
+                n = data[i + 1]
+                if n == "#":
+                    cur.append("#")
+                    i += 2
+                    continue
+                if n == "\n":
+                    i += 2
+                    continue
+                if n == "\r":
+                    i += 3 if data[i + 2:i + 3] == "\n" else 2
+                    continue
+                cur.append(c)
+                i += 1
+                continue
+            if c == "#":
+                # Comments run to the end of the line
+                end = data.find("\n", i)
+                i = length if end < 0 else end
+                continue
+            if c == "\n":
+                lines.append("".join(cur))
+                cur = list()
+                i += 1
+                continue
+            cur.append(c)
+            i += 1
+        if len(cur) > 0:
+            lines.append("".join(cur))
+        return lines
+
+    def expand(self, value):
+        """ Expand ${var} references, and $$ to a literal $ """
+        def sub(match):
+            if match.group(0) == "$$":
+                return "$"
+            return self.variables.get(match.group(1), "")
+        return pc_var.sub(sub, value)
+
+    def parse_line(self, line):
+        m = pc_line.match(line.strip())
+        if m is None:
+            return
+        name, kind, value = m.groups()
+        value = self.expand(value.strip())
+        if kind == "=":
+            # First definition wins, as with pkg-config
+            if name not in self.variables:
+                self.variables[name] = value
+        elif name not in self.fields:
+            self.fields[name] = value
+
+    def parse_modules(self, value):
+        """ Parse a module list into (name, operator, version) tuples, with
+            the operator and version set to None when unconstrained """
+        ret = list()
+        name = None
+        op = None
+        want_version = False
+        for tok in pc_module_token.findall(value):
+            if tok == ",":
+                continue
+            if tok[0] in "<>=!":
+                if name is None or op is not None:
+                    raise PkgConfigError("Unexpected operator '{}' in {}".
+                                         format(tok, self.path))
+                if tok not in pc_operators:
+                    raise PkgConfigError("Unknown operator '{}' in {}".
+                                         format(tok, self.path))
+                op = tok
+                want_version = True
+                continue
+            if want_version:
+                ret.append((name, op, tok))
+                name = None
+                op = None
+                want_version = False
+                continue
+            if name is not None:
+                ret.append((name, None, None))
+            name = tok
+        if want_version:
+            raise PkgConfigError("Missing version for '{}' in {}".
+                                 format(name, self.path))
+        if name is not None:
+            ret.append((name, None, None))
+        return ret
@@ -0,0 +1,164 @@
+#!/bin/true
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+
+from . import console_ui
+
+import hashlib
+import os
+import sqlite3
+
+# Bump this whenever the schema or the set of indexed files changes
+INDEX_VERSION = 1
+
+Schema = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS packages (name TEXT PRIMARY KEY, "
+    "stamp TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS libraries (path TEXT NOT NULL, "
+    "package TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS libraries_path ON libraries (path)",
+    "CREATE INDEX IF NOT EXISTS libraries_package ON libraries (package)",
+    "CREATE TABLE IF NOT EXISTS pkgconfigs (name TEXT NOT NULL, "
+    "emul32 INTEGER NOT NULL, package TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS pkgconfigs_name ON pkgconfigs (name, emul32)",
+    "CREATE INDEX IF NOT EXISTS pkgconfigs_package ON pkgconfigs (package)",
+]
+
+
+def get_package_stamps(idb):
+    """ Stamp every installed package, each of which changes whenever the
+        package is reinstalled, upgraded or downgraded """
+    stamps = dict()
+    for name in idb.list_installed():
+        pkgdir = idb.package_path(name)
+        try:
+            st = os.stat(pkgdir)
+        except Exception as e:
+            continue
+        stamps[name] = "{}:{}".format(os.path.basename(pkgdir), st.st_mtime)
+    return stamps
+
+
+def get_installdb_stamp(stamps):
+    """ Single stamp for the whole InstallDB from the package stamps """
+    h = hashlib.sha1()
+    for name in sorted(stamps):
+        h.update("{}={}\n".format(name, stamps[name]))
+    return h.hexdigest()
+
+
+class ProviderIndex:
+    """ Persistent index of the shared libraries and pkg-config names
+        provided by the installed packages, so that the resolver can find
+        a provider with a single indexed lookup instead of searching the
+        whole files database for every library search path.
+
+        The index is kept in sync with the InstallDB incrementally. Every
+        installed package has a stamp derived from its directory in the
+        package database, and only packages whose stamp changed since the
+        last refresh are read again. """
+
+    path = None
+    db = None
+    idb = None
+
+    def __init__(self, path, idb):
+        self.path = path
+        self.idb = idb
+
+        parent = os.path.dirname(path)
+        if not os.path.exists(parent):
+            os.makedirs(parent, mode=00755)
+        self.db = sqlite3.connect(path)
+        self.db.text_factory = str
+
+        with self.db:
+            for stmt in Schema:
+                self.db.execute(stmt)
+            row = self.db.execute("SELECT value FROM meta WHERE key = "
+                                  "'version'").fetchone()
+            if row is None or row[0] != str(INDEX_VERSION):
+                # Start over rather than trying to migrate
+                for table in ["packages", "libraries", "pkgconfigs"]:
+                    self.db.execute("DELETE FROM {}".format(table))
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES "
+                                "('version', ?)", (str(INDEX_VERSION),))
+
+    @staticmethod
+    def is_library(path):
+        """ Only shared objects are indexed, anything else must still be
+            searched for in the files database """
+        return ".so" in os.path.basename(path)
+
+    def forget_package(self, name):
+        self.db.execute("DELETE FROM packages WHERE name = ?", (name,))
+        self.db.execute("DELETE FROM libraries WHERE package = ?", (name,))
+        self.db.execute("DELETE FROM pkgconfigs WHERE package = ?", (name,))
+
+    def index_package(self, name, stamp):
+        libs = list()
+        for file in self.idb.get_files(name).list:
+            fpath = "/" + file.path
+            if self.is_library(fpath):
+                libs.append((fpath, name))
+        self.db.executemany("INSERT INTO libraries VALUES (?, ?)", libs)
+
+        pcs = list()
+        pkg = self.idb.get_package(name)
+        for pc in pkg.providesPkgConfig:
+            pcs.append((pc.om, 0, name))
+        for pc in pkg.providesPkgConfig32:
+            pcs.append((pc.om, 1, name))
+        self.db.executemany("INSERT INTO pkgconfigs VALUES (?, ?, ?)", pcs)
+
+        self.db.execute("INSERT INTO packages VALUES (?, ?)", (name, stamp))
+
+    def refresh(self, stamps=None):
+        """ Bring the index up to date with the InstallDB, optionally with
+            the package stamps already computed """
+        if stamps is None:
+            stamps = get_package_stamps(self.idb)
+
+        known = dict(self.db.execute("SELECT name, stamp FROM packages"))
+        stale = [x for x in known if stamps.get(x) != known[x]]
+        fresh = [x for x in stamps if known.get(x) != stamps[x]]
+        if len(stale) == 0 and len(fresh) == 0:
+            return
+
+        with self.db:
+            for name in stale:
+                self.forget_package(name)
+            for name in fresh:
+                self.index_package(name, stamps[name])
+        console_ui.emit_info("Index", "Updated provider index for {} "
+                             "packages".format(len(set(stale + fresh))))
+
+    def get_library_provider(self, path):
+        """ Return the installed package providing the library path """
+        row = self.db.execute("SELECT package FROM libraries WHERE path = ? "
+                              "ORDER BY rowid LIMIT 1", (path,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def get_pkgconfig_provider(self, name, emul32=False):
+        """ Return the installed package providing the pkg-config name """
+        row = self.db.execute("SELECT package FROM pkgconfigs WHERE name = ? "
+                              "AND emul32 = ? ORDER BY rowid LIMIT 1",
+                              (name, 1 if emul32 else 0)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def close(self):
+        self.db.close()
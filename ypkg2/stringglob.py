@@ -13,55 +13,65 @@
 
 import fnmatch
 import os
+import re
 
 
-class StringPathGlob:
+class StringPathGlob(object):
+    """ A path glob, compiled once into a matcher per path component so that
+        match() does no splitting or pattern checks of its own. Paths may
+        be passed pre-split, allowing a single split per file no matter how
+        many globs it is tested against. """
 
-    pattern = None
-    prefixMatch = False
-    priority = 0
+    __slots__ = ["pattern", "prefixMatch", "priority", "matchers"]
 
     def __init__(self, pattern, prefixMatch=False, priority=0):
         self.pattern = pattern
         self.prefixMatch = prefixMatch
         self.priority = priority
 
+        # Prefix globs only ever match literally
+        if self.prefixMatch:
+            if not self.pattern.endswith(os.sep) or \
+                    StringPathGlob.is_a_pattern(self.pattern):
+                self.matchers = None
+            else:
+                self.matchers = []
+            return
+
+        # (component, regex) pairs, with no regex for literal components
+        self.matchers = list()
+        for elem in self.pattern.split(os.sep):
+            regex = None
+            if StringPathGlob.is_a_pattern(elem):
+                regex = re.compile(fnmatch.translate(elem))
+            self.matchers.append((elem, regex))
+
     @staticmethod
     def is_a_pattern(item):
         if "[" in item or "?" in item or "*" in item:
             return True
         return False
 
-    def match(self, path):
+    def match(self, path, splits=None):
+        """ Match the path, optionally already split on os.sep """
         if self.prefixMatch:
-            if self.pattern.endswith(os.sep) and not \
-              StringPathGlob.is_a_pattern(self.pattern):
-                if path.startswith(self.pattern):
-                    return True
-            return False
-
-        our_splits = self.pattern.split(os.sep)
-        test_splits = path.split(os.sep)
-
-        their_len = len(test_splits)
-        our_len = len(our_splits)
+            if self.matchers is None:
+                return False
+            return path.startswith(self.pattern)
 
-        if our_len > their_len:
+        if splits is None:
+            splits = path.split(os.sep)
+        if len(self.matchers) > len(splits):
             return False
 
-        for i in range(0, our_len):
-            our_elem = our_splits[i]
-            their_elem = test_splits[i]
-
+        i = 0
+        for our_elem, regex in self.matchers:
+            their_elem = splits[i]
+            i += 1
             if our_elem == their_elem:
                 continue
-
-            if StringPathGlob.is_a_pattern(our_elem):
-                if not fnmatch.fnmatchcase(their_elem, our_elem):
-                    return False
-            else:
+            if regex is None or regex.match(their_elem) is None:
                 return False
-
         return True
 
     def __str__(self):
@@ -81,3 +91,114 @@ class StringPathGlob:
 
     def get_priority(self):
         return self.priority
+
+
+class PathGlobNode:
+    """ A single path component within a PathGlobIndex """
+
+    literals = None
+    globs = None
+
+    # Best (key, glob) ending exactly here, and requiring a further component
+    best = None
+    best_prefix = None
+
+    # Best key found anywhere within this subtree
+    best_below = None
+
+    def __init__(self):
+        self.literals = dict()
+        self.globs = list()
+
+
+class PathGlobIndex:
+    """ Path component trie built over a set of StringPathGlobs, giving the
+        same answer as matching every glob and sorting by priority, at the
+        cost of a single walk of the path.
+
+        Literal components are dict edges, and glob components are edges
+        carrying a precompiled regex. Each node holds the best glob ending
+        there, so no sorting is needed. Globs of equal priority are ranked
+        by their order in the iterable the index was built from. """
+
+    root = None
+
+    def __init__(self, globs):
+        self.root = PathGlobNode()
+        for rank, glob in enumerate(globs):
+            self.add(glob, (glob.priority, -rank))
+
+    def add(self, glob, key):
+        if glob.prefixMatch:
+            # Prefix globs are always literal, with a trailing separator
+            if glob.matchers is None:
+                return
+            matchers = [(x, None) for x in glob.pattern.split(os.sep)[:-1]]
+        else:
+            matchers = glob.matchers
+
+        node = self.root
+        nodes = [node]
+        for elem, regex in matchers:
+            if regex is not None:
+                child = None
+                for pat, gregex, gnode in node.globs:
+                    if pat == elem:
+                        child = gnode
+                        break
+                if child is None:
+                    child = PathGlobNode()
+                    node.globs.append((elem, regex, child))
+            else:
+                child = node.literals.get(elem)
+                if child is None:
+                    child = PathGlobNode()
+                    node.literals[elem] = child
+            node = child
+            nodes.append(node)
+
+        if glob.prefixMatch:
+            if node.best_prefix is None or key > node.best_prefix[0]:
+                node.best_prefix = (key, glob)
+        elif node.best is None or key > node.best[0]:
+            node.best = (key, glob)
+        for node in nodes:
+            if node.best_below is None or key > node.best_below:
+                node.best_below = key
+
+    def match(self, path):
+        """ Return the best glob matching the path, or None """
+        splits = path.split(os.sep)
+        depth = len(splits)
+        best = None
+
+        nodes = [self.root]
+        for i in range(0, depth + 1):
+            children = list()
+            for node in nodes:
+                # Nothing below can beat what we already have
+                if best is not None and node.best_below < best[0]:
+                    continue
+                if node.best is not None:
+                    if best is None or node.best[0] > best[0]:
+                        best = node.best
+                if i == depth:
+                    continue
+                if node.best_prefix is not None:
+                    if best is None or node.best_prefix[0] > best[0]:
+                        best = node.best_prefix
+
+                elem = splits[i]
+                child = node.literals.get(elem)
+                if child is not None:
+                    children.append(child)
+                for pat, regex, gnode in node.globs:
+                    if elem == pat or regex.match(elem):
+                        children.append(gnode)
+            nodes = children
+            if len(nodes) == 0:
+                break
+
+        if best is None:
+            return None
+        return best[1]
@@ -0,0 +1,103 @@
+#!/bin/true
+# -*- coding: utf-8 -*-
+#
+#  This file is part of ypkg2
+#
+#  Copyright 2015-2016 Ikey Doherty <ikey@solus-project.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+
+import json
+
+
+class ToolTimings:
+    """ Wall time, number of uses and number of processes spawned for each
+        tool. Instances are plain data so they can be returned from the
+        worker pool and merged in the main process. """
+
+    times = None
+    calls = None
+    spawns = None
+
+    def __init__(self):
+        self.times = dict()
+        self.calls = dict()
+        self.spawns = dict()
+
+    def add(self, tool, elapsed, spawns=0):
+        """ Record a single use of the given tool """
+        self.times[tool] = self.times.get(tool, 0.0) + elapsed
+        self.calls[tool] = self.calls.get(tool, 0) + 1
+        self.spawns[tool] = self.spawns.get(tool, 0) + spawns
+
+    def merge(self, other):
+        """ Fold another set of timings into this one """
+        for tool in other.times:
+            self.times[tool] = self.times.get(tool, 0.0) + other.times[tool]
+            self.calls[tool] = self.calls.get(tool, 0) + other.calls[tool]
+            self.spawns[tool] = self.spawns.get(tool, 0) + other.spawns[tool]
+
+    def get_tools(self):
+        """ Tools sorted by the time spent in them, slowest first """
+        return sorted(self.times, key=lambda x: (-self.times[x], x))
+
+
+class ExamineTimings:
+    """ Collected timings for the whole examine phase """
+
+    tools = None
+    files = None
+    elapsed = 0.0
+
+    def __init__(self):
+        self.tools = ToolTimings()
+        self.files = list()
+        self.elapsed = 0.0
+
+    def add_file(self, package, pretty, elapsed):
+        self.files.append((elapsed, package, pretty))
+
+    def get_slowest(self, count=None):
+        """ Files sorted by examination time, slowest first """
+        ret = sorted(self.files, key=lambda x: (-x[0], x[2]))
+        if count is not None:
+            ret = ret[0:count]
+        return ret
+
+    def print_summary(self, top=10):
+        """ Print the per tool table and the slowest files """
+        print("{:<12} {:>8} {:>8} {:>10}".format("Tool", "Calls", "Spawned",
+                                                 "Seconds"))
+        for tool in self.tools.get_tools():
+            print("{:<12} {:>8} {:>8} {:>10.3f}".format(
+                  tool, self.tools.calls[tool], self.tools.spawns[tool],
+                  self.tools.times[tool]))
+        print("{:<12} {:>8} {:>8} {:>10.3f}".format(
+              "total", len(self.files), sum(self.tools.spawns.values()),
+              self.elapsed))
+
+        slowest = self.get_slowest(top)
+        if len(slowest) == 0:
+            return
+        print("\nSlowest files:")
+        for elapsed, package, pretty in slowest:
+            print("{:>10.3f} {} ({})".format(elapsed, pretty, package))
+
+    def write(self, path):
+        """ Write all timings out as JSON, to be trended across builds """
+        tools = dict()
+        for tool in self.tools.times:
+            tools[tool] = {
+                "seconds": self.tools.times[tool],
+                "calls": self.tools.calls[tool],
+                "spawned": self.tools.spawns[tool],
+            }
+        files = [{"path": p, "package": n, "seconds": e}
+                 for e, n, p in self.get_slowest()]
+        data = {"seconds": self.elapsed, "tools": tools, "files": files}
+        with open(path, "w") as out:
+            json.dump(data, out, indent=4, sort_keys=True)
@@ -103,6 +103,10 @@ class BuildConfig:
 
     jobcount = 2
 
+    # Maximum size of the examination cache in bytes, 0 disables it. Set
+    # with examine_cache_size in the [build] section of eopkg.conf
+    examine_cache_size = 2 * 1024 * 1024 * 1024
+
     def get_flags(self, t):
         """ Simple switch to grab a set of flags by a type """
         if t == Flags.C:
@@ -164,6 +168,14 @@ class YpkgContext:
             return "/var/ypkg-root"
         return "{}/YPKG".format(os.path.expanduser("~"))
 
+    def get_examine_cache_dir(self):
+        """ Get the persistent examination cache directory """
+        return os.path.join(self.get_build_prefix(), "examine-cache")
+
+    def get_provider_index_path(self):
+        """ Get the persistent provider index database """
+        return os.path.join(self.get_build_prefix(), "provider-index.db")
+
     def get_install_dir(self):
         """ Get the install directory for the given package """
         return os.path.abspath("{}/root/{}/install".format(
@@ -272,6 +284,18 @@ class YpkgContext:
                                     "Invalid job count of {}, defaulting to 2".
                                     format(jobs))
 
+        # Not a stock eopkg.conf key, so unset reads as an empty string
+        cache_size = getattr(conf.values.build, "examine_cache_size", "")
+        if cache_size:
+            try:
+                self.build.examine_cache_size = max(int(cache_size), 0)
+            except Exception as e:
+                console_ui.emit_warning("BUILD",
+                                        "Invalid examine_cache_size of {}, "
+                                        "defaulting to {}".format(
+                                            cache_size,
+                                            self.build.examine_cache_size))
+
         self.global_archive_dir = conf.values.dirs.archives_dir
 
     def enable_pgo_generate(self):
@@ -89,6 +89,10 @@ class YpkgSpec:
     pkg_extract = True
     pkg_optimize = None
     pkg_libsplit = True
+    pkg_dwz = False
+    pkg_compressdebug = False
+    pkg_fusedstrip = False
+    pkg_compactpspec = False
 
     # Dependencies
     pkg_builddeps = None
@@ -191,6 +195,10 @@ class YpkgSpec:
             ("autodep", bool),
             ("extract", bool),
             ("libsplit", bool),
+            ("dwz", bool),
+            ("compressdebug", bool),
+            ("fusedstrip", bool),
+            ("compactpspec", bool),
             ("patterns", MultimapFormat(self, self.add_pattern, "main")),
             ("builddeps", OneOrMoreString),
             ("rundeps", MultimapFormat(self, self.add_rundep, "main")),